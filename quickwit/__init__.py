@@ -1,2 +1,2 @@
 """Loads the quickwit bot"""
-from quickwit.bot import QuickWit
+from quickwit.bot import QuickWit, ShardedQuickWit
@@ -2,7 +2,8 @@
 import os
 import sys
 import dotenv
-from quickwit import QuickWit
+from quickwit import QuickWit, ShardedQuickWit
+from quickwit.utils import get_env_flag
 
 if __name__ == "__main__":
     dotenv.load_dotenv()
@@ -10,5 +11,15 @@ if __name__ == "__main__":
     if token is None:
         print('$DISCORD_TOKEN not set, cannot continue')
         sys.exit(1)
-    quickwit = QuickWit(os.getenv('ADMIN_USER_ID'))
+
+    if get_env_flag('QUICKWIT_SHARDED'):
+        options = {}
+        if os.getenv('QUICKWIT_SHARD_COUNT'):
+            options['shard_count'] = int(os.getenv('QUICKWIT_SHARD_COUNT'))
+        if os.getenv('QUICKWIT_SHARD_IDS'):
+            options['shard_ids'] = [int(shard_id)
+                                    for shard_id in os.getenv('QUICKWIT_SHARD_IDS').split(',')]
+        quickwit = ShardedQuickWit(os.getenv('ADMIN_USER_ID'), **options)
+    else:
+        quickwit = QuickWit(os.getenv('ADMIN_USER_ID'))
     quickwit.run(token=os.getenv('DISCORD_TOKEN'))
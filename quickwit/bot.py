@@ -1,50 +1,208 @@
 """Provides the quickwit bot"""
+import functools
+import hashlib
+import json
 import logging
+import os
+import resource
 import sys
+import time
+from typing import Callable
 import discord
 from discord.ext import commands
 from quickwit import cogs, utils
+from quickwit.cogs.storage import Storage, DATA_FOLDER_NAME
+from quickwit.errors import ErrorDigest, DEFAULT_WINDOW_MINUTES
+from quickwit.logs import setup_logging, log_context, context_of
+from quickwit.profiling import Profiler, DEFAULT_SLOW_CALL_THRESHOLD_MS
+from quickwit.watchdog import LoopWatchdog, DEFAULT_HEARTBEAT_MS
+from quickwit.metrics import metrics
 
+DEFAULT_DISPLAY_NAME_CACHE_SIZE = 10000
+COMMAND_TREE_HASH_NAME = 'command_tree.sha256'
+SCHEDULED_EVENT_USER_EVENTS = {
+    'GUILD_SCHEDULED_EVENT_USER_ADD': 'scheduled_event_user_add',
+    'GUILD_SCHEDULED_EVENT_USER_REMOVE': 'scheduled_event_user_remove'
+}
 
 class QuickWit(commands.Bot):
     """Wrapper around a commands.Bot to provide QuickWit functionalities"""
 
-    def __init__(self, admin_user_id: int):
+    def __init__(self, admin_user_id: int, **options):
+        self._started_at = time.monotonic()
         intents = discord.Intents.default()
         intents.members = True
-        super().__init__(command_prefix='/', intents=intents)
 
-        self._admin_user_id = admin_user_id
+        # Lean mode only caches the bot's own member, display names are fetched on demand instead
+        self.lean_members = utils.get_env_flag('QUICKWIT_LEAN_MEMBERS')
+        if self.lean_members:
+            options.setdefault('chunk_guilds_at_startup', False)
+            options.setdefault('member_cache_flags', discord.MemberCacheFlags.none())
+        super().__init__(command_prefix='/', intents=intents, **options)
+
+        self.admin_user_id = int(admin_user_id) if admin_user_id is not None else None
         self.admin = None
+        self.display_names = utils.LRUCache[tuple[int, int], str](utils.get_env_int(
+            'QUICKWIT_DISPLAY_NAME_CACHE_SIZE', DEFAULT_DISPLAY_NAME_CACHE_SIZE))
+        metrics.register_gauge('display_name_cache_size', lambda: len(self.display_names))
+        metrics.register_gauge('process_max_resident_bytes', _max_resident_bytes)
+
+        # Without a member cache most users are unknown to discord.py, which discards
+        # scheduled event subscriptions of unknown users, so dispatch those with a partial user
+        if self.lean_members:
+            for event, event_name in SCHEDULED_EVENT_USER_EVENTS.items():
+                self._connection.parsers[event] = functools.partial(
+                    self._parse_scheduled_event_user, event_name)
+
+        # Tag log records with the IDs of the interaction being handled, its tasks are
+        # created while parsing, so the context has to be set before that
+        parse_interaction_create = self._connection.parsers['INTERACTION_CREATE']
+        self._connection.parsers['INTERACTION_CREATE'] = functools.partial(
+            self._parse_interaction_create, parse_interaction_create)
+
+        # Opt-in instrumentation of all cog handlers
+        self.profiler = None
+        if utils.get_env_flag('QUICKWIT_PROFILING'):
+            self.profiler = Profiler(utils.get_env_float(
+                'QUICKWIT_SLOW_CALL_MS', DEFAULT_SLOW_CALL_THRESHOLD_MS))
+            self.profiler.instrument_http(self.http)
+
+        # Opt-in detection of event loop stalls
+        self.watchdog = None
+        stall_threshold_ms = utils.get_env_float('QUICKWIT_STALL_THRESHOLD_MS', 0)
+        if stall_threshold_ms > 0:
+            self.watchdog = LoopWatchdog(stall_threshold_ms, utils.get_env_float(
+                'QUICKWIT_STALL_HEARTBEAT_MS', DEFAULT_HEARTBEAT_MS))
+
+        # Errors are aggregated so outages don't flood the admin's DMs
+        self.errors = ErrorDigest(
+            self._send_to_admin,
+            utils.get_env_float('QUICKWIT_ERROR_DIGEST_MINUTES', DEFAULT_WINDOW_MINUTES))
+
+        # Setup logger, records are written by a background thread
+        self.log_listener = setup_logging()
+
+    def run(self, *args, **kwargs):
+        # discord.py would otherwise attach its own synchronous handler to the root logger
+        kwargs.setdefault('log_handler', None)
+        super().run(*args, **kwargs)
 
-        # Setup logger
-        logger = logging.getLogger('quickwit')
-        logger.setLevel(logging.INFO)
-        handler = logging.StreamHandler()
-        formatter = logging.Formatter(
-            '\x1b[30;1m%(asctime)s\x1b[0m %(levelname)-8s\x1b[0m \x1b[35m%(name)s\x1b[0m %(message)s',
-            '%Y-%m-%d %H:%M:%S')
-        handler.setFormatter(formatter)
-        logger.addHandler(handler)
+    async def setup_hook(self):
+        if self.watchdog is not None:
+            self.watchdog.start()
+        self.errors.start()
+        await self._load_extensions()
+
+    async def close(self):
+        if self.watchdog is not None:
+            self.watchdog.stop()
+        await self.errors.stop()
+        await super().close()
 
     async def on_ready(self):
         """Called when quickwit is ready"""
         logging.getLogger(__name__).info("Logged in as %s", self.user)
-        await self._load_extensions()
+        logging.getLogger(__name__).info(
+            "Ready after %.1fs with %i guilds, %i cached members and %.1f MiB peak resident memory "
+            "(%s member cache)", time.monotonic() - self._started_at, len(self.guilds),
+            sum(len(guild.members) for guild in self.guilds), _max_resident_bytes() / 2 ** 20,
+            'lean' if self.lean_members else 'full')
 
-        # Notify admin of boot
-        self.admin = await utils.grab_by_id(self._admin_user_id, self.get_user, self.fetch_user)
+        # on_ready is dispatched again after reconnecting, only notify the admin of the first boot
+        if self.admin is not None:
+            return
+        self.admin = await utils.grab_by_id(self.admin_user_id, self.get_user, self.fetch_user)
         if self.admin is not None:
             await self.admin.send(content="Booting up")
 
+    async def on_shard_ready(self, shard_id: int):
+        """Called when a shard is ready, only dispatched when running sharded"""
+        logging.getLogger(__name__).info(
+            "Shard %i ready with latency %.0fms", shard_id, self.get_shard(shard_id).latency * 1000)
+        metrics.register_gauge(f'gateway_latency_seconds{{shard="{shard_id}"}}',
+                               lambda: self.get_shard(shard_id).latency)
+
     async def on_error(self, event_method: str, /, *_, **__):
-        error = f'An error occured during execution of {
-            event_method}:\n{sys.exception()}'
-        logging.getLogger(__name__).error(error)
+        logging.getLogger(__name__).exception('An error occured during execution of %s', event_method)
+
+        # Notify the admin of new errors right away, repeated errors are sent as a digest
+        error = sys.exception()
+        if error is not None:
+            await self.errors.record(event_method, error)
 
-        # Attempt to notify admin of error
+    async def _send_to_admin(self, content: str):
         if self.admin is not None:
-            await self.admin.send(content=error)
+            await self.admin.send(content=content)
+
+    def owned_shards(self) -> tuple[int, list[int]] | None:
+        """The shard count and the shards running in this process, None when it handles every guild"""
+        if self.shard_count is None or self.shard_count <= 1:
+            return None
+
+        shard_ids = getattr(self, 'shard_ids', None)
+        if shard_ids is None:
+            if self.shard_id is None:
+                return None
+            shard_ids = [self.shard_id]
+        return self.shard_count, list(shard_ids)
+
+    def owns_guild(self, guild_id: int) -> bool:
+        """Whether a guild is handled by a shard running in this process"""
+        shards = self.owned_shards()
+        return shards is None or (guild_id >> 22) % shards[0] in shards[1]
+
+    def shard_latencies(self) -> list[tuple[int, float]]:
+        """The gateway latency in seconds of every shard running in this process"""
+        if isinstance(self, commands.AutoShardedBot):
+            return self.latencies
+        return [(self.shard_id or 0, self.latency)]
+
+    def _command_tree_hash(self) -> str:
+        """Hash the payload a command tree sync would send, along with the application it's sent for"""
+        payload = sorted((command.to_dict(self.tree) for command in self.tree.get_commands()),
+                         key=lambda command: command['name'])
+        tree = json.dumps([self.application_id, payload], sort_keys=True, default=str)
+        return hashlib.sha256(tree.encode()).hexdigest()
+
+    def dispatch(self, event_name: str, /, *args, **kwargs):
+        # Listener tasks copy the context when created, tagging their log records with the event's IDs
+        token = log_context.set({**(log_context.get() or {}), **context_of(*args)})
+        try:
+            super().dispatch(event_name, *args, **kwargs)
+        finally:
+            log_context.reset(token)
+
+    @staticmethod
+    def _parse_interaction_create(parse: Callable[[dict], None], data: dict):
+        user = data.get('member', {}).get('user') or data.get('user') or {}
+        context = {name: int(value) for name, value in (
+            ('guild_id', data.get('guild_id')),
+            ('channel_id', data.get('channel_id') or data.get('channel', {}).get('id')),
+            ('user_id', user.get('id'))) if value is not None}
+        token = log_context.set(context)
+        try:
+            parse(data)
+        finally:
+            log_context.reset(token)
+
+    def _parse_scheduled_event_user(self, event_name: str, data: dict):
+        guild = self.get_guild(int(data['guild_id']))
+        if guild is None:
+            return
+        scheduled_event = guild.get_scheduled_event(int(data['guild_scheduled_event_id']))
+        if scheduled_event is None:
+            return
+
+        user_id = int(data['user_id'])
+        user = self.get_user(user_id) or discord.Object(user_id)
+        self.dispatch(event_name, scheduled_event, user)
+
+    async def add_cog(self, cog: commands.Cog, /, **kwargs):
+        if self.profiler is not None:
+            if isinstance(cog, Storage):
+                self.profiler.instrument_storage(cog)
+            self.profiler.instrument_cog(cog)
+        await super().add_cog(cog, **kwargs)
 
     async def _load_extensions(self):
         """Loads all relevant extensions"""
@@ -53,13 +211,41 @@ class QuickWit(commands.Bot):
         await self.add_cog(cogs.Announce(self))
         await self.add_cog(cogs.ScheduledEvents(self))
         await self.add_cog(cogs.UI(self))
+        await self.add_cog(cogs.Statistics(self))
+        await self.add_cog(cogs.Listing(self))
+        calendar_port = utils.get_env_int('QUICKWIT_CALENDAR_PORT', 0)
+        if calendar_port > 0:
+            await self.add_cog(cogs.Calendar(self, calendar_port))
+        await self.add_cog(cogs.Backup(self))
+        await self.add_cog(cogs.Reconciler(self))
+        await self.add_cog(cogs.Admin(self))
+
+        # Syncing is rate limited, only sync when the commands changed since the last sync
+        tree_hash = self._command_tree_hash()
+        hash_path = os.path.join(DATA_FOLDER_NAME, COMMAND_TREE_HASH_NAME)
+        if os.path.exists(hash_path):
+            with open(hash_path, 'r', encoding='utf-8') as file:
+                if file.read().strip() == tree_hash:
+                    logging.getLogger(__name__).info("Commands unchanged, skipping sync")
+                    return
 
         try:
             synced = await self.tree.sync()
             logging.getLogger(__name__).info("Synced %i commands", len(synced))
+            with open(hash_path, 'w', encoding='utf-8') as file:
+                file.write(tree_hash)
         except (discord.HTTPException,
                 discord.app_commands.CommandSyncFailure,
                 discord.Forbidden,
                 discord.app_commands.MissingApplicationID,
                 discord.app_commands.TranslationError) as e:
             logging.getLogger(__name__).info("Failed to sync commands: %s", e)
+
+
+def _max_resident_bytes() -> int:
+    """Peak resident memory of this process, ru_maxrss is reported in KiB on Linux"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class ShardedQuickWit(QuickWit, commands.AutoShardedBot):
+    """QuickWit running multiple gateway connections, only handling guilds of its own shards"""
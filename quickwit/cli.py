@@ -0,0 +1,206 @@
+"""Admin command line tools for quickwit's database
+
+Usage:
+    python -m quickwit.cli export <directory> [--format jsonl|csv]
+    python -m quickwit.cli import <directory> [--format jsonl|csv]
+    python -m quickwit.cli vacuum
+    python -m quickwit.cli rebuild-stats
+    python -m quickwit.cli backup [--directory <directory>]
+    python -m quickwit.cli restore <snapshot>
+"""
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import sys
+import time
+from typing import Iterable, Iterator
+from quickwit.cogs.backup import BACKUP_FOLDER_NAME, create_backup, restore_backup
+from quickwit.cogs.storage import DATA_FOLDER_NAME, DATABASE_NAME, NecessaryScripts, \
+    connect, migrate, load_scripts, rebuild_statistics
+
+BATCH_SIZE = 10000
+FORMATS = ('jsonl', 'csv')
+NULLABLE_COLUMNS = {'scheduled_event_id', 'job', 'tank_cap', 'healer_cap', 'dps_cap'}
+
+# Tables in foreign key order, with their columns in the order of their insert script
+TABLES = {
+    'Events': (NecessaryScripts.IMPORT_EVENT,
+               ['channel_id', 'event_type', 'name', 'description', 'scheduled_event_id',
+                'organiser_id', 'utc_start', 'utc_end', 'guild_id', 'reminder',
+                'tank_cap', 'healer_cap', 'dps_cap']),
+    'Registrations': (NecessaryScripts.REGISTER_USER,
+                      ['channel_id', 'user_id', 'job', 'status', 'waitlisted']),
+    'UserTimezones': (NecessaryScripts.SET_TIMEZONE, ['user_id', 'timezone'])
+}
+
+
+def read_rows(conn: sqlite3.Connection, table: str, columns: list[str]) -> Iterator[tuple]:
+    """Stream all rows of a table, fetching them in batches"""
+    cursor = conn.execute(f'SELECT {", ".join(columns)} FROM {table}')
+    while rows := cursor.fetchmany(BATCH_SIZE):
+        yield from rows
+
+
+def write_rows(path: str, file_format: str, columns: list[str], rows: Iterable[tuple]) -> int:
+    """Write rows to a file line by line, returning the amount of rows written"""
+    count = 0
+    with open(path, 'w', encoding='utf-8', newline='') as file:
+        writer = None
+        if file_format == 'csv':
+            writer = csv.writer(file)
+            writer.writerow(columns)
+        for row in rows:
+            if writer is None:
+                file.write(json.dumps(dict(zip(columns, row))) + '\n')
+            else:
+                writer.writerow(row)
+            count += 1
+    return count
+
+
+def parse_rows(path: str, file_format: str, columns: list[str]) -> Iterator[list]:
+    """Stream rows from a file line by line, ordered by the given columns"""
+    with open(path, 'r', encoding='utf-8', newline='') as file:
+        if file_format == 'csv':
+            for record in csv.DictReader(file):
+                # CSV has no notion of NULL, empty fields are written for them, so only empty fields
+                # of nullable columns are NULL. Columns missing from older exports are read as NULL
+                # too, taking their default on import
+                yield [None if record.get(column) is None
+                       or (record[column] == '' and column in NULLABLE_COLUMNS)
+                       else record[column] for column in columns]
+        else:
+            for line in file:
+                if line.strip() == '':
+                    continue
+                record = json.loads(line)
+                yield [record.get(column, None) for column in columns]
+
+
+def batched(rows: Iterable[list], size: int) -> Iterator[list[list]]:
+    """Group rows into lists of at most size rows"""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def export_tables(conn: sqlite3.Connection, directory: str, file_format: str):
+    """Export every table to its own file within a directory"""
+    os.makedirs(directory, exist_ok=True)
+    for table, (_, columns) in TABLES.items():
+        start = time.perf_counter()
+        path = os.path.join(directory, f'{table}.{file_format}')
+        count = write_rows(path, file_format, columns, read_rows(conn, table, columns))
+        report(f'Exported {table}', count, time.perf_counter() - start)
+
+
+def import_tables(conn: sqlite3.Connection, directory: str, file_format: str):
+    """Import every table from its own file within a directory, overwriting existing rows"""
+    scripts = load_scripts()
+    for table, (script, columns) in TABLES.items():
+        path = os.path.join(directory, f'{table}.{file_format}')
+        if not os.path.exists(path):
+            print(f'Skipping {table}, {path} does not exist')
+            continue
+
+        start = time.perf_counter()
+        count = 0
+        for batch in batched(parse_rows(path, file_format, columns), BATCH_SIZE):
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.executemany(scripts[script], batch)
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+            count += len(batch)
+        report(f'Imported {table}', count, time.perf_counter() - start)
+
+
+def vacuum(conn: sqlite3.Connection):
+    """Rewrite the database with incremental vacuuming enabled, so the bot can release free pages
+        step by step rather than rewriting the whole database while running
+    """
+    conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    conn.execute('VACUUM')
+
+
+def report(action: str, count: int, seconds: float):
+    """Print the amount of rows processed and the throughput"""
+    print(f'{action}: {count} rows in {seconds:.2f}s ({count / max(seconds, 1e-9):.0f} rows/s)')
+
+
+def main(argv: list[str] | None = None):
+    """Run the command line tools"""
+    parser = argparse.ArgumentParser(prog='python -m quickwit.cli', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', default=os.path.join(DATA_FOLDER_NAME, DATABASE_NAME),
+                        help='Path to the database (default: %(default)s)')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = subparsers.add_parser(
+        'export', help='Stream events, registrations and timezones to files')
+    export_parser.add_argument('directory', help='Directory to write one file per table to')
+    export_parser.add_argument('--format', choices=FORMATS, default='jsonl')
+
+    import_parser = subparsers.add_parser(
+        'import', help='Stream events, registrations and timezones from files')
+    import_parser.add_argument('directory', help='Directory containing one file per table')
+    import_parser.add_argument('--format', choices=FORMATS, default='jsonl')
+
+    subparsers.add_parser(
+        'vacuum', help='Rewrite the database so free pages can be released while running, '
+        'the bot must be stopped')
+
+    subparsers.add_parser(
+        'rebuild-stats', help='Recount attendance statistics from archived events')
+
+    backup_parser = subparsers.add_parser(
+        'backup', help='Take a compressed snapshot of the database, safe while the bot is running')
+    backup_parser.add_argument('--directory', default=os.path.join(DATA_FOLDER_NAME, BACKUP_FOLDER_NAME),
+                               help='Directory to write the snapshot to (default: %(default)s)')
+
+    restore_parser = subparsers.add_parser(
+        'restore', help='Overwrite the database with a snapshot, the bot must be stopped')
+    restore_parser.add_argument('snapshot', help='Path to the snapshot to restore')
+
+    args = parser.parse_args(argv)
+
+    # Snapshots are taken and restored as is, without migrating
+    if args.command == 'backup':
+        print(create_backup(args.database, args.directory))
+        return
+    if args.command == 'restore':
+        start = time.perf_counter()
+        restore_backup(args.snapshot, args.database)
+        print(f'Restored {args.snapshot} in {time.perf_counter() - start:.2f}s')
+        return
+
+    conn = connect(args.database)
+    migrate(conn)
+
+    if args.command == 'export':
+        export_tables(conn, args.directory, args.format)
+    elif args.command == 'import':
+        import_tables(conn, args.directory, args.format)
+    elif args.command == 'vacuum':
+        start = time.perf_counter()
+        vacuum(conn)
+        print(f'Vacuumed the database in {time.perf_counter() - start:.2f}s')
+    elif args.command == 'rebuild-stats':
+        start = time.perf_counter()
+        corrected = rebuild_statistics(conn)
+        print(f'Rebuilt statistics in {time.perf_counter() - start:.2f}s, '
+              f'corrected {corrected} rows')
+    conn.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
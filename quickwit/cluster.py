@@ -0,0 +1,167 @@
+"""For running quickwit as a cluster of worker processes sharing a single database
+
+Every worker runs a sharded bot owning a contiguous range of shards,
+e.g. `QUICKWIT_CLUSTER_WORKERS=3 QUICKWIT_SHARD_COUNT=6 python -m quickwit.cluster`.
+Pass `--check` to check cache invalidation between that many processes on a temporary database instead.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+import dotenv
+from quickwit.cogs.storage import DATABASE_NAME, Storage
+from quickwit.models import Event, EventType, Registration, Status
+from quickwit.utils import get_env_int
+
+DEFAULT_WORKERS = 2
+WORKER_START_DELAY_SECONDS = 5
+WORKER_RESTART_DELAY_SECONDS = 10
+CHECK_CHANNEL_ID = 1
+CHECK_GUILD_ID = 1
+CHECK_TIMEOUT_SECONDS = 30
+
+
+def shard_ranges(shard_count: int, workers: int) -> list[list[int]]:
+    """Split all shards into contiguous ranges, one per worker"""
+    base, remainder = divmod(shard_count, workers)
+    ranges = []
+    start = 0
+    for worker in range(workers):
+        size = base + (1 if worker < remainder else 0)
+        ranges.append(list(range(start, start + size)))
+        start += size
+    return ranges
+
+
+def run_worker(token: str, admin_user_id: str, shard_ids: list[int], shard_count: int):
+    """Run a single sharded bot, the entry point of every worker process"""
+    # Imported here so the bot is only constructed within the worker process
+    from quickwit import ShardedQuickWit  # pylint: disable=import-outside-toplevel
+
+    os.environ['QUICKWIT_SHARED_STORAGE'] = '1'
+    quickwit = ShardedQuickWit(admin_user_id, shard_ids=shard_ids, shard_count=shard_count)
+    quickwit.run(token=token)
+
+
+def check_worker(database_path: str, worker: int, barrier, results):
+    """Run a single worker of the cluster check, registering itself to the event shared by all"""
+    os.environ['QUICKWIT_SHARED_STORAGE'] = '1'
+    storage = Storage(None, database_path)
+    if worker == 0:
+        start = datetime.now(timezone.utc) + timedelta(days=1)
+        storage.store_event(Event(CHECK_CHANNEL_ID, EventType.FF14, 'Cluster check', '', 0, start,
+                                  start + timedelta(hours=1), CHECK_GUILD_ID, start, []))
+    barrier.wait()
+
+    # Cache the event before any other worker registers
+    storage.get_event(CHECK_CHANNEL_ID)
+    barrier.wait()
+    storage.register(CHECK_CHANNEL_ID, Registration(worker, Status.ATTENDING))
+    barrier.wait()
+
+    # A single poll must invalidate the registrations made by every other worker
+    asyncio.run(storage.poll_changes())
+    event = storage.get_event(CHECK_CHANNEL_ID)
+    results.put((worker, sorted(registration.user_id for registration in event.registrations)))
+    storage.conn.close()
+
+
+def check(workers: int) -> bool:
+    """Check that cached events are invalidated across worker processes sharing a database
+
+    Every worker caches the same event, registers to it and then must see all registrations.
+    """
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as directory:
+        # Create the database up front, so the workers don't race to create it
+        database_path = os.path.join(directory, DATABASE_NAME)
+        Storage(None, database_path).conn.close()
+
+        barrier = context.Barrier(workers, timeout=CHECK_TIMEOUT_SECONDS)
+        results = context.Queue()
+        processes = [context.Process(target=check_worker,
+                                     args=(database_path, worker, barrier, results))
+                     for worker in range(workers)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join(CHECK_TIMEOUT_SECONDS)
+
+        expected = list(range(workers))
+        succeeded = all(process.exitcode == 0 for process in processes)
+        for _ in range(workers if succeeded else 0):
+            worker, registered = results.get(timeout=CHECK_TIMEOUT_SECONDS)
+            print(f'Worker {worker} sees registrations of workers {registered}')
+            succeeded &= registered == expected
+    return succeeded
+
+
+def main():
+    """Start all workers and restart any worker that stops unexpectedly"""
+    dotenv.load_dotenv()
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s %(levelname)-8s %(name)s %(message)s')
+    workers = get_env_int('QUICKWIT_CLUSTER_WORKERS', DEFAULT_WORKERS)
+    if '--check' in sys.argv[1:]:
+        succeeded = check(workers)
+        print('Cluster check passed' if succeeded else 'Cluster check failed')
+        sys.exit(0 if succeeded else 1)
+
+    token = os.getenv('DISCORD_TOKEN')
+    if token is None:
+        print('$DISCORD_TOKEN not set, cannot continue')
+        sys.exit(1)
+
+    shard_count = get_env_int('QUICKWIT_SHARD_COUNT', workers)
+    if workers < 1 or shard_count < workers:
+        print('Need at least one worker and one shard per worker, cannot continue')
+        sys.exit(1)
+
+    context = multiprocessing.get_context('spawn')
+    ranges = shard_ranges(shard_count, workers)
+    processes = dict[int, multiprocessing.Process]()
+    stopping = False
+
+    def start(worker: int):
+        process = context.Process(
+            target=run_worker, name=f'quickwit-worker-{worker}',
+            args=(token, os.getenv('ADMIN_USER_ID'), ranges[worker], shard_count))
+        process.start()
+        processes[worker] = process
+        logging.getLogger(__name__).info('Started worker %i (pid %i) with shards %s',
+                                         worker, process.pid, ranges[worker])
+
+    def stop(*_):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    # Stagger startup so workers don't identify all at once
+    for worker in range(workers):
+        start(worker)
+        time.sleep(WORKER_START_DELAY_SECONDS)
+
+    while not stopping:
+        time.sleep(1)
+        for worker, process in list(processes.items()):
+            if not process.is_alive() and not stopping:
+                logging.getLogger(__name__).warning(
+                    'Worker %i exited with code %s, restarting', worker, process.exitcode)
+                time.sleep(WORKER_RESTART_DELAY_SECONDS)
+                start(worker)
+
+    for process in processes.values():
+        process.terminate()
+    for process in processes.values():
+        process.join()
+
+
+if __name__ == '__main__':
+    main()
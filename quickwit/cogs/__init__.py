@@ -3,4 +3,12 @@ from .event_crud import EventCRUD
 from .timezone import Timezone
 from .announce import Announce
 from .ui import UI
-from .scheduled_events import ScheduledEvents
\ No newline at end of file
+from .scheduled_events import ScheduledEvents
+from .admin import Admin
+from .statistics import Statistics
+from .listing import Listing
+from .calendar import Calendar
+from .backup import Backup
+from .event_role import EventRole
+from .reconciler import Reconciler
+from .outbox import Outbox
\ No newline at end of file
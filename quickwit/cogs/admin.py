@@ -0,0 +1,96 @@
+"""The admin cog providing diagnostics to the bot admin"""
+import io
+import sqlite3
+from logging import getLogger
+import discord
+from discord.ext import commands
+from quickwit.metrics import metrics
+from .backup import Backup
+
+MAX_PROFILE_SECONDS = 300
+DEFAULT_PROFILE_SECONDS = 30
+
+
+class Admin(commands.Cog):
+    """Cog providing diagnostic commands, restricted to the bot admin"""
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id == self.bot.admin_user_id:
+            return True
+        await interaction.response.send_message(
+            content='Only the bot admin may use this command', ephemeral=True)
+        return False
+
+    async def cog_app_command_error(self, interaction: discord.Interaction,
+                                    error: discord.app_commands.AppCommandError):
+        # Failed checks have already been responded to
+        if isinstance(error, discord.app_commands.CheckFailure):
+            return
+        getLogger(__name__).error('Admin command %s failed: %s', interaction.command.name, error)
+
+    @discord.app_commands.command()
+    @discord.app_commands.default_permissions(administrator=True)
+    async def profile(self, interaction: discord.Interaction,
+                      seconds: int = DEFAULT_PROFILE_SECONDS):
+        """Profiles the bot and sends handler statistics along with a cProfile snapshot
+
+        Args:
+            seconds (int): The amount of seconds to run cProfile for, 0 for statistics only
+        """
+        if self.bot.profiler is None:
+            await interaction.response.send_message(
+                content='Profiling is disabled, set QUICKWIT_PROFILING to enable it',
+                ephemeral=True)
+            return
+
+        if seconds < 0 or seconds > MAX_PROFILE_SECONDS:
+            await interaction.response.send_message(
+                content=f'Seconds must be between 0 and {MAX_PROFILE_SECONDS}', ephemeral=True)
+            return
+
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        files = [discord.File(io.BytesIO(self.bot.profiler.snapshot().encode()),
+                              filename='handlers.txt')]
+        if seconds > 0:
+            try:
+                profile = await self.bot.profiler.profile(seconds)
+            except RuntimeError as e:
+                await interaction.followup.send(content=str(e), ephemeral=True)
+                return
+            files.append(discord.File(io.BytesIO(profile.encode()), filename='profile.txt'))
+        await interaction.followup.send(content='Profiling results', files=files, ephemeral=True)
+
+    @discord.app_commands.command()
+    @discord.app_commands.default_permissions(administrator=True)
+    async def metrics(self, interaction: discord.Interaction):
+        """Sends all collected metrics"""
+        rendered = metrics.render() or 'No metrics collected yet'
+        await interaction.response.send_message(
+            file=discord.File(io.BytesIO(rendered.encode()), filename='metrics.txt'),
+            ephemeral=True)
+
+    @discord.app_commands.command()
+    @discord.app_commands.default_permissions(administrator=True)
+    async def backup(self, interaction: discord.Interaction):
+        """Backs up the database right away and reports how long it took"""
+        backup = self.bot.get_cog(Backup.__name__)
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        try:
+            report = await backup.backup()
+        except (OSError, sqlite3.Error) as e:
+            await interaction.followup.send(content=f'Backup failed: {e}', ephemeral=True)
+            return
+        await interaction.followup.send(
+            content=str(report) if report is not None else 'Another backup is already running',
+            ephemeral=True)
+
+    @discord.app_commands.command()
+    @discord.app_commands.default_permissions(administrator=True)
+    async def latency(self, interaction: discord.Interaction):
+        """Sends the gateway latency of every shard running in this process"""
+        message = '\n'.join(f'Shard {shard_id}: {latency * 1000:.0f}ms'
+                            for shard_id, latency in self.bot.shard_latencies())
+        await interaction.response.send_message(content=message, ephemeral=True)
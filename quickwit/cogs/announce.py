@@ -58,7 +58,10 @@ class Announce(commands.Cog):
     async def send_reminders(self):
         """Sends out reminders for upcoming events"""
         reminders = self.storage.get_active_reminders()
-        for channel_id in reminders:
+        for channel_id, guild_id in reminders:
+            # Guilds of other shards are handled by their own process
+            if not self.bot.owns_guild(guild_id):
+                continue
             if channel_id in self.already_reminded:
                 break
             event = self.storage.get_event(channel_id)
@@ -78,3 +81,8 @@ class Announce(commands.Cog):
             getLogger(__name__).info(
                 'Sent reminder for event %s', event.name)
             self.already_reminded.append(event.channel_id)
+
+    @send_reminders.before_loop
+    async def before_send_reminders(self):
+        """Wait until connected before sending out reminders"""
+        await self.bot.wait_until_ready()
@@ -0,0 +1,196 @@
+"""Cog taking online backups of the database"""
+import asyncio
+import fcntl
+import gzip
+import os
+import shutil
+import sqlite3
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from logging import getLogger
+from discord.ext import commands, tasks
+from quickwit.utils import get_env_float, get_env_int
+from quickwit.metrics import metrics
+from .storage import DATA_FOLDER_NAME, DATABASE_NAME, connect
+
+BACKUP_FOLDER_NAME = 'backups'
+BACKUP_PREFIX = 'events-'
+BACKUP_SUFFIX = '.db.gz'
+LOCK_NAME = '.lock'
+DEFAULT_INTERVAL_HOURS = 24
+DEFAULT_RETENTION = 7
+COMPRESSION_CHUNK_BYTES = 1024 * 1024
+COMPRESSION_LEVEL = 6
+
+
+@dataclass
+class BackupReport:
+    """Describes a finished backup"""
+    path: str
+    pages: int
+    seconds: float
+    size: int
+
+    def __str__(self):
+        return f'Backed up {self.pages} pages in {self.seconds:.2f}s ' \
+            f'to {self.path} ({self.size / 1024:.0f} KiB)'
+
+
+def list_backups(directory: str) -> list[str]:
+    """List the paths of all snapshots within a directory, oldest first"""
+    if not os.path.isdir(directory):
+        return []
+    return [os.path.join(directory, file) for file in sorted(os.listdir(directory))
+            if file.startswith(BACKUP_PREFIX) and file.endswith(BACKUP_SUFFIX)]
+
+
+def create_backup(database_path: str, directory: str) -> BackupReport:
+    """Copy the database into a compressed, timestamped snapshot using SQLite's online backup API
+
+    The database is copied in a single step from the read snapshot of a WAL connection, so writers
+    are never blocked. Copying in several steps would restart from the first page whenever the bot
+    writes in between, possibly never finishing on a busy bot.
+    Blocks for the duration of the backup, run it in a worker thread from within the event loop.
+
+    Raises:
+        sqlite3.DatabaseError: Raised when the snapshot turned out to be corrupt
+    """
+    os.makedirs(directory, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    path = os.path.join(directory, f'{BACKUP_PREFIX}{stamp}{BACKUP_SUFFIX}')
+    temporary_path = f'{path}.tmp'
+
+    start = time.perf_counter()
+    pages = 0
+
+    def progress(_, remaining: int, total: int):
+        nonlocal pages
+        pages = total - remaining
+
+    try:
+        source = connect(database_path)
+        target = sqlite3.connect(temporary_path)
+        try:
+            source.backup(target, progress=progress)
+            result = target.execute('PRAGMA quick_check').fetchone()[0]
+            if result != 'ok':
+                raise sqlite3.DatabaseError(f'Snapshot failed its integrity check: {result}')
+        finally:
+            target.close()
+            source.close()
+
+        # Only complete snapshots are given their final name
+        with open(temporary_path, 'rb') as snapshot, \
+                gzip.open(f'{path}.part', 'wb', COMPRESSION_LEVEL) as compressed:
+            shutil.copyfileobj(snapshot, compressed, COMPRESSION_CHUNK_BYTES)
+        os.replace(f'{path}.part', path)
+    finally:
+        for leftover_path in (temporary_path, f'{path}.part'):
+            if os.path.exists(leftover_path):
+                os.remove(leftover_path)
+    return BackupReport(path, pages, time.perf_counter() - start, os.path.getsize(path))
+
+
+def prune_backups(directory: str, retention: int) -> list[str]:
+    """Remove all but the newest snapshots, returning the paths of removed snapshots"""
+    backups = list_backups(directory)
+    removed = backups[:max(len(backups) - retention, 0)]
+    for path in removed:
+        os.remove(path)
+    return removed
+
+
+def restore_backup(snapshot_path: str, database_path: str):
+    """Overwrite the database with a snapshot, the bot must not be running while restoring
+
+    Raises:
+        sqlite3.DatabaseError: Raised when the snapshot is corrupt, leaving the database untouched
+    """
+    temporary_path = f'{database_path}.restore'
+    try:
+        with gzip.open(snapshot_path, 'rb') as compressed, open(temporary_path, 'wb') as snapshot:
+            shutil.copyfileobj(compressed, snapshot, COMPRESSION_CHUNK_BYTES)
+
+        source = sqlite3.connect(temporary_path)
+        try:
+            result = source.execute('PRAGMA quick_check').fetchone()[0]
+            if result != 'ok':
+                raise sqlite3.DatabaseError(f'Snapshot failed its integrity check: {result}')
+
+            # Restoring through the backup API keeps the database's journal consistent
+            target = connect(database_path)
+            try:
+                source.backup(target)
+            finally:
+                target.close()
+        finally:
+            source.close()
+    finally:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+
+
+class Backup(commands.Cog):
+    """Cog periodically backing up the database without blocking the event loop"""
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.database_path = os.path.join(DATA_FOLDER_NAME, DATABASE_NAME)
+        self.directory = os.getenv('QUICKWIT_BACKUP_DIRECTORY',
+                                   os.path.join(DATA_FOLDER_NAME, BACKUP_FOLDER_NAME))
+        self.interval_hours = get_env_float('QUICKWIT_BACKUP_INTERVAL_HOURS', DEFAULT_INTERVAL_HOURS)
+        self.retention = get_env_int('QUICKWIT_BACKUP_RETENTION', DEFAULT_RETENTION)
+        self.last_report = None
+
+    async def cog_load(self):
+        if self.interval_hours > 0:
+            self.backup_database.change_interval(hours=self.interval_hours)
+            self.backup_database.start()
+
+    async def cog_unload(self):
+        self.backup_database.cancel()
+
+    @tasks.loop(hours=DEFAULT_INTERVAL_HOURS)
+    async def backup_database(self):
+        """Take a scheduled backup"""
+        backups = list_backups(self.directory)
+        # Every process sharing the database schedules backups, only the first one takes it
+        if backups and time.time() - os.path.getmtime(backups[-1]) < self.interval_hours * 3600 / 2:
+            return
+        try:
+            await self.backup()
+        except (OSError, sqlite3.Error) as e:
+            metrics.increment('database_backup_failures')
+            getLogger(__name__).error('Failed to back up the database: %s', e)
+
+    async def backup(self) -> BackupReport | None:
+        """Take a backup in a worker thread and prune old snapshots
+
+        Returns:
+            BackupReport | None: The report of the backup, None when another backup is running
+        """
+        report = await asyncio.to_thread(self._backup)
+        if report is None:
+            getLogger(__name__).info('Skipping backup, another backup is running')
+            return None
+
+        self.last_report = report
+        metrics.increment('database_backups')
+        metrics.observe('database_backup_seconds', report.seconds)
+        metrics.observe('database_backup_pages', report.pages)
+        getLogger(__name__).info('%s', report)
+        return report
+
+    def _backup(self) -> BackupReport | None:
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, LOCK_NAME), 'w', encoding='utf-8') as lock:
+            # Processes sharing the database must not back it up at the same time
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return None
+            report = create_backup(self.database_path, self.directory)
+            for path in prune_backups(self.directory, self.retention):
+                getLogger(__name__).info('Removed expired backup %s', path)
+            return report
@@ -0,0 +1,178 @@
+"""The calendar cog serving iCalendar feeds of events over HTTP"""
+import hashlib
+import hmac
+import os
+import secrets
+from logging import getLogger
+import discord
+from aiohttp import web
+from discord.ext import commands
+from quickwit.models import Event
+from quickwit.utils import LRUCache, get_display_name, get_env_int, grab_by_id
+from quickwit.views import CalendarFeed
+from quickwit.metrics import metrics
+from .storage import Storage, DATA_FOLDER_NAME
+
+SECRET_NAME = 'calendar.secret'
+DEFAULT_HOST = '0.0.0.0'
+DEFAULT_FEED_CACHE_SIZE = 1000
+SHARED_FEED_TTL_SECONDS = 300
+SIGNATURE_LENGTH = 32
+
+
+class Calendar(commands.Cog):
+    """Cog serving per-guild and per-user iCalendar feeds, rendered once per change to the guild
+
+    Feeds are addressed through URLs signed with a secret, so they can't be guessed.
+    Feeds are read from storage, so any process sharing it serves the feeds of every guild.
+    Rendered feeds are cached along with the guild's version at render time, any dispatched
+    change to one of the guild's events bumps that version and thereby invalidates its feeds.
+    """
+
+    def __init__(self, bot: commands.Bot, port: int):
+        self.bot = bot
+        self.storage = self.bot.get_cog(Storage.__name__)
+        self.port = port
+        self.host = os.getenv('QUICKWIT_CALENDAR_HOST', DEFAULT_HOST)
+        self.base_url = os.getenv('QUICKWIT_CALENDAR_URL', f'http://localhost:{port}').rstrip('/')
+        self.secret = self._load_secret()
+        self._versions = dict[int, int]()
+        self._feeds = None
+        self._runner = None
+
+    async def cog_load(self):
+        if self.storage is None:
+            self.storage = Storage(self.bot)
+            await self.bot.add_cog(self.storage)
+
+        # Changes made by other processes aren't dispatched here, so expire their feeds instead
+        ttl = SHARED_FEED_TTL_SECONDS if self.storage.shared else None
+        self._feeds = LRUCache[tuple[int, int | None], tuple[int, str, bytes]](
+            get_env_int('QUICKWIT_CALENDAR_CACHE_SIZE', DEFAULT_FEED_CACHE_SIZE), ttl)
+        metrics.register_gauge('calendar_feed_cache_size', lambda: len(self._feeds))
+
+        app = web.Application()
+        app.add_routes([web.get('/calendar/{guild_id}.ics', self.serve_guild_feed),
+                        web.get('/calendar/{guild_id}/{user_id}.ics', self.serve_user_feed)])
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port, reuse_port=self.storage.shared)
+        await site.start()
+        getLogger(__name__).info('Serving calendar feeds on %s:%i', self.host, self.port)
+
+    async def cog_unload(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    @commands.Cog.listener()
+    async def on_event_created(self, event: Event, _):
+        """Invalidates the feeds of the event's guild"""
+        self._invalidate(event.guild_id)
+
+    @commands.Cog.listener()
+    async def on_event_altered(self, event: Event, _):
+        """Invalidates the feeds of the event's guild"""
+        self._invalidate(event.guild_id)
+
+    @commands.Cog.listener()
+    async def on_event_deleted(self, event: Event):
+        """Invalidates the feeds of the event's guild"""
+        self._invalidate(event.guild_id)
+
+    @commands.Cog.listener()
+    async def on_registrations_altered(self, event: Event):
+        """Invalidates the feeds of the event's guild, as user feeds follow registrations"""
+        self._invalidate(event.guild_id)
+
+    @discord.app_commands.command()
+    @discord.app_commands.guild_only()
+    async def calendar(self, interaction: discord.Interaction):
+        """Sends links to subscribe to this server's events and your own events in a calendar app"""
+        guild_id = interaction.guild_id
+        user_id = interaction.user.id
+        await interaction.response.send_message(
+            content='Subscribe to these links in your calendar app:\n'
+            f'All events: <{self.base_url}/calendar/{guild_id}.ics?key={self._sign(guild_id)}>\n'
+            f'Your events: <{self.base_url}/calendar/{guild_id}/{user_id}.ics'
+            f'?key={self._sign(guild_id, user_id)}>',
+            ephemeral=True)
+
+    async def serve_guild_feed(self, request: web.Request) -> web.Response:
+        """Serves the feed of all events of a guild"""
+        return await self._serve_feed(request, request.match_info['guild_id'], None)
+
+    async def serve_user_feed(self, request: web.Request) -> web.Response:
+        """Serves the feed of all events a user registered for within a guild"""
+        return await self._serve_feed(
+            request, request.match_info['guild_id'], request.match_info['user_id'])
+
+    async def _serve_feed(self, request: web.Request, guild_id: str,
+                          user_id: str | None) -> web.Response:
+        if not guild_id.isdigit() or (user_id is not None and not user_id.isdigit()):
+            raise web.HTTPNotFound()
+        guild_id = int(guild_id)
+        user_id = int(user_id) if user_id is not None else None
+        if not hmac.compare_digest(request.query.get('key', ''), self._sign(guild_id, user_id)):
+            raise web.HTTPNotFound()
+
+        etag, body = await self._get_feed(guild_id, user_id)
+        headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+        if_none_match = request.headers.get('If-None-Match', '')
+        if if_none_match.strip() == '*' or etag in (tag.strip() for tag in if_none_match.split(',')):
+            metrics.increment('calendar_feeds_not_modified')
+            return web.Response(status=304, headers=headers)
+        return web.Response(body=body, content_type='text/calendar', charset='utf-8',
+                            headers=headers)
+
+    async def _get_feed(self, guild_id: int, user_id: int | None) -> tuple[str, bytes]:
+        """Get a rendered feed along with its ETag, rendering it only when the guild changed"""
+        version = self._versions.get(guild_id, 0)
+        cached = self._feeds.get((guild_id, user_id))
+        if cached is not None and cached[0] == version:
+            return cached[1], cached[2]
+
+        events = self.storage.get_calendar_events(guild_id, user_id)
+        # Guilds of other shards aren't cached here, but can still be fetched
+        guild = await grab_by_id(guild_id, self.bot.get_guild, self.bot.fetch_guild)
+        organisers = dict[int, str]()
+        if guild is not None:
+            for organiser_id in {event.organiser_id for event in events}:
+                organisers[organiser_id] = await get_display_name(
+                    guild, discord.Object(organiser_id), self.bot.display_names)
+
+        name = guild.name if guild is not None else f'Guild {guild_id}'
+        if user_id is not None:
+            name += ' (registered)'
+        body = str(CalendarFeed(name, events, organisers)).encode()
+        etag = f'"{hashlib.sha256(body).hexdigest()}"'
+        self._feeds.put((guild_id, user_id), (version, etag, body))
+        metrics.increment('calendar_feeds_rendered')
+        return etag, body
+
+    def _invalidate(self, guild_id: int):
+        self._versions[guild_id] = self._versions.get(guild_id, 0) + 1
+
+    def _sign(self, guild_id: int, user_id: int | None = None) -> str:
+        message = f'{guild_id}:{user_id if user_id is not None else ""}'.encode()
+        return hmac.new(self.secret, message, hashlib.sha256).hexdigest()[:SIGNATURE_LENGTH]
+
+    def _load_secret(self) -> bytes:
+        """Load the secret signing feed URLs, generating one on first use so URLs survive restarts"""
+        secret = os.getenv('QUICKWIT_CALENDAR_SECRET')
+        if secret:
+            return secret.encode()
+
+        path = os.path.join(DATA_FOLDER_NAME, SECRET_NAME)
+        if not os.path.exists(path):
+            # Linking fails when another process sharing the data folder created the secret first
+            temporary_path = f'{path}.{os.getpid()}'
+            with open(temporary_path, 'w', encoding='utf-8') as file:
+                file.write(secrets.token_hex(32))
+            try:
+                os.link(temporary_path, path)
+            except FileExistsError:
+                pass
+            finally:
+                os.remove(temporary_path)
+        with open(path, 'r', encoding='utf-8') as file:
+            return file.read().strip().encode()
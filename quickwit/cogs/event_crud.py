@@ -1,10 +1,11 @@
 """Cog handling all CRUD operations for Events"""
 from datetime import timedelta, time, datetime
+from itertools import batched
 from logging import getLogger
 import discord
 import pytz
 from discord.ext import commands, tasks
-from quickwit.models import EventType, Event
+from quickwit.models import EventType, Event, FF14Role, SideEffect, SideEffectKind
 from quickwit.utils import grab_by_id, get_timezone_aware_datetime_from_supported_formats, \
     get_datetime_from_supported_formats
 from .storage import Storage
@@ -16,6 +17,10 @@ MAX_EVENT_NAME_LENGTH = 25
 MAX_EVENT_DESCRIPTION_LENGTH = 1000
 EVENT_CHANNEL_CATEGORY = 'events'
 DEFAULT_EVENT_TYPE = EventType.FF14
+ARCHIVE_BATCH_SIZE = 100
+DEFAULT_TANK_CAP = 2
+DEFAULT_HEALER_CAP = 2
+DEFAULT_DPS_CAP = 4
 
 
 def validate_inputs(name: str | None, start: str | None, duration: int | None,
@@ -62,7 +67,6 @@ class EventCRUD(commands.Cog):
         if self.storage is None:
             self.storage = Storage(self.bot)
             await self.bot.add_cog(self.storage)
-        await self.prune_events()
         self.prune_events.start()
 
     async def cog_app_command_error(self, interaction: discord.Interaction, _):
@@ -148,10 +152,21 @@ class EventCRUD(commands.Cog):
         event = Event(event_channel.id, event_type,
                       name, description, interaction.user.id,
                       utc_start, utc_end, interaction.guild_id, reminder_time, [])
-        self.storage.store_event(event)
+
+        # Messages and the scheduled event are committed along with the event and posted in the
+        # background, the attachment is passed by URL as it outlives this interaction
+        payload = {'channel_id': event_channel.id}
+        if image is not None:
+            payload.update(attachment_id=image.id, attachment_url=image.url,
+                           attachment_filename=image.filename)
+        self.storage.store_event(event, [
+            SideEffect(kind, f'{kind}:{event_channel.id}', interaction.guild_id, payload)
+            for kind in (SideEffectKind.POST_EVENT_MESSAGES, SideEffectKind.CREATE_SCHEDULED_EVENT)])
 
         getLogger(__name__).info('Created event \"%s\" (channel %i)',
-                                 event.name, event_channel.id)
+                                 event.name, event_channel.id,
+                                 extra={'guild_id': event.guild_id, 'channel_id': event.channel_id,
+                                        'user_id': event.organiser_id})
         self.bot.dispatch('event_created', event, image)
 
     @discord.app_commands.command()
@@ -216,9 +231,61 @@ class EventCRUD(commands.Cog):
         self.storage.store_event(event)
         self.bot.dispatch('event_altered', event, image)
 
+    @discord.app_commands.command()
+    async def composition(self, interaction: discord.Interaction, tanks: int = DEFAULT_TANK_CAP,
+                          healers: int = DEFAULT_HEALER_CAP, dps: int = DEFAULT_DPS_CAP,
+                          uncapped: bool = False):
+        """Caps the members per role of this channel's FF14 event, benching anyone who doesn't fit
+
+        Args:
+            tanks (int): The maximum amount of tanks
+            healers (int): The maximum amount of healers
+            dps (int): The maximum amount of DPS
+            uncapped (bool): Remove the caps instead, promoting everyone on the waitlist
+        """
+        if min(tanks, healers, dps) < 0:
+            await interaction.response.send_message(
+                content='Caps must be positive numbers', ephemeral=True)
+            return
+
+        # Compositions can only be set from the event's channel
+        event = self.storage.get_event(interaction.channel_id)
+        if event is None:
+            await interaction.response.send_message(
+                content='Could not find any event associated with this channel', ephemeral=True)
+            return
+
+        if interaction.user.id != event.organiser_id:
+            await interaction.response.send_message(
+                content='Only the event organiser may update this event', ephemeral=True)
+            return
+
+        if event.event_type != EventType.FF14:
+            await interaction.response.send_message(
+                content=f'Only {EventType.FF14} events have a party composition', ephemeral=True)
+            return
+
+        caps = None if uncapped else {
+            FF14Role.TANK: tanks, FF14Role.HEALER: healers, FF14Role.DPS: dps}
+        promoted, benched = self.storage.set_composition(event.channel_id, caps)
+        message = 'Removed the party composition' if caps is None else \
+            f'Capped the party at {tanks} tanks, {healers} healers and {dps} DPS'
+        if promoted:
+            message += f', promoting {len(promoted)} members from the waitlist'
+        if benched:
+            message += f', benching {len(benched)} members onto the waitlist'
+        await interaction.response.send_message(content=message, ephemeral=True)
+
+        # The event was read again under the new caps
+        self.bot.dispatch('registrations_altered', self.storage.get_event(event.channel_id))
+
     @commands.Cog.listener()
     async def on_guild_channel_delete(self, channel: discord.abc.GuildChannel):
         """Delete the associated event when the channel is deleted"""
+        # Most deleted channels are unrelated to events, reject those without any I/O
+        if not self.storage.is_event_channel(channel.id):
+            return
+
         event = self.storage.get_event(channel.id)
         if event is None:
             return
@@ -227,18 +294,22 @@ class EventCRUD(commands.Cog):
         self.bot.dispatch('event_deleted', event)
 
     @commands.Cog.listener()
-    async def on_member_remove(self, member: discord.Member):
-        """Remove a member who left the guild from any associated events"""
-        channel_ids = self.storage.get_registered_event_ids(member.id)
+    async def on_raw_member_remove(self, payload: discord.RawMemberRemoveEvent):
+        """Remove a member who left the guild from any associated events,
+            listening to the raw event as the member may not be cached
+        """
+        channel_ids = self.storage.get_registered_event_ids(payload.user.id)
         for channel_id in channel_ids:
+            event = self.storage.get_event(channel_id)
+            if event is None or event.guild_id != payload.guild_id:
+                continue
+
             channel = await grab_by_id(channel_id, self.bot.get_channel, self.bot.fetch_channel)
             if channel is not None:
-                await channel.send(f'{member.display_name} unregistered by leaving the server')
+                await channel.send(f'{payload.user.display_name} unregistered by leaving the server')
 
-            self.storage.unregister(channel_id, member.id)
-            event = self.storage.get_event(channel_id)
-            if event is not None:
-                self.bot.dispatch('registrations_altered', event, None)
+            self.storage.unregister(channel_id, payload.user.id)
+            self.bot.dispatch('registrations_altered', event)
 
     @tasks.loop(time=time(0, 0, 0))
     async def prune_events(self):
@@ -246,9 +317,30 @@ class EventCRUD(commands.Cog):
         getLogger(__name__).info('Pruning events')
         past_events = self.storage.get_past_events()
 
-        # Delete the channels
-        for channel_id, _, __ in past_events:
-            channel = await grab_by_id(channel_id, self.bot.get_channel, self.bot.fetch_channel)
-            if channel is not None:
-                await channel.delete(reason='Event has ended')
-        getLogger(__name__).info('Done pruning events')
+        # Guilds of other shards are handled by their own process
+        channel_ids = [channel_id for channel_id, _, guild_id in past_events
+                       if self.bot.owns_guild(guild_id)]
+
+        # Archive the events in batches, then delete their channels
+        for batch in batched(channel_ids, ARCHIVE_BATCH_SIZE):
+            for event in self.storage.archive_events(list(batch)):
+                channel = await grab_by_id(event.channel_id, self.bot.get_channel,
+                                           self.bot.fetch_channel)
+                if channel is not None:
+                    # The event is archived already, so a failed deletion must not stop the batch
+                    try:
+                        await channel.delete(reason='Event has ended')
+                    except discord.HTTPException as e:
+                        getLogger(__name__).warning(
+                            'Failed to delete channel of ended event %i: %s', event.channel_id, e,
+                            extra={'guild_id': event.guild_id, 'channel_id': event.channel_id})
+                self.bot.dispatch('event_deleted', event)
+
+        await self.storage.optimize()
+        getLogger(__name__).info('Done pruning %i events', len(channel_ids))
+
+    @prune_events.before_loop
+    async def before_prune_events(self):
+        """Prune events which ended while offline once connected, so deletions reach the listeners"""
+        await self.bot.wait_until_ready()
+        await self.prune_events()
@@ -0,0 +1,83 @@
+"""The event role cog resolving the role mentioned by events"""
+from logging import getLogger
+import discord
+from discord.ext import commands
+from .storage import Storage
+
+DEFAULT_EVENT_ROLE_NAME = 'Events'
+
+
+class EventRole(commands.Cog):
+    """Cog caching the role mentioned by events per guild, invalidated whenever the guild's roles change"""
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.storage = self.bot.get_cog(Storage.__name__)
+        # Role ID per guild, None when the guild's default role is used instead
+        self._role_ids = dict[int, int | None]()
+
+    async def cog_load(self):
+        if self.storage is None:
+            self.storage = Storage(self.bot)
+            await self.bot.add_cog(self.storage)
+
+    async def get_role(self, guild: discord.Guild) -> discord.Role:
+        """Retrieves the event role of a guild, defaulting to the guild's default role"""
+        if guild.id in self._role_ids:
+            role_id = self._role_ids[guild.id]
+            role = guild.default_role if role_id is None else guild.get_role(role_id)
+            if role is not None:
+                return role
+
+        # Only resolve the role by name when the guild's roles changed since last time
+        name = self.storage.get_event_role_name(guild.id) or DEFAULT_EVENT_ROLE_NAME
+        roles = guild.roles
+        if len(roles) == 0:
+            # Fetched roles aren't added to the guild's cache, so search them directly
+            roles = await guild.fetch_roles()
+        role = discord.utils.get(roles, name=name)
+        self._role_ids[guild.id] = None if role is None else role.id
+        if role is None:
+            # The default role shares its ID with the guild
+            role = discord.utils.get(roles, id=guild.id) or guild.default_role
+        return role
+
+    def invalidate(self, guild_id: int):
+        """Drop the cached event role of a guild"""
+        self._role_ids.pop(guild_id, None)
+
+    @commands.Cog.listener()
+    async def on_guild_role_create(self, role: discord.Role):
+        """Invalidates the event role, the created role may be the event role"""
+        self.invalidate(role.guild.id)
+
+    @commands.Cog.listener()
+    async def on_guild_role_update(self, _: discord.Role, after: discord.Role):
+        """Invalidates the event role, the updated role may have been renamed to or from it"""
+        self.invalidate(after.guild.id)
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role: discord.Role):
+        """Invalidates the event role, the deleted role may be the event role"""
+        self.invalidate(role.guild.id)
+
+    @discord.app_commands.command()
+    @discord.app_commands.guild_only()
+    @discord.app_commands.default_permissions(manage_roles=True)
+    async def event_role(self, interaction: discord.Interaction, name: str | None = None):
+        """Sets the name of the role mentioned by events in this server
+
+        Args:
+            interaction (discord.Interaction): The Discord interaction relating to the command call
+            name (str | None): The name of the role, leave empty to reset it to 'Events'
+        """
+        self.storage.set_event_role_name(interaction.guild_id, name)
+        self.invalidate(interaction.guild_id)
+        role = await self.get_role(interaction.guild)
+        getLogger(__name__).info('Guild %i set its event role to %s',
+                                 interaction.guild_id, name or DEFAULT_EVENT_ROLE_NAME)
+
+        message = f'Events will mention the {name or DEFAULT_EVENT_ROLE_NAME} role'
+        if role == interaction.guild.default_role:
+            message += ', which does not exist yet, so the default role is used for now'
+        await interaction.response.send_message(content=message, ephemeral=True)
@@ -0,0 +1,74 @@
+"""The listing cog for browsing a guild's events"""
+import discord
+from discord.ext import commands
+from quickwit.models import EventType
+from quickwit.views import EventListMessage, PageButton
+from .storage import Storage
+
+EVENTS_PER_PAGE = 10
+PAGE_TIMEOUT_SECONDS = 600
+
+
+class Listing(commands.Cog):
+    """Cog to list upcoming events page by page"""
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.storage = self.bot.get_cog(Storage.__name__)
+
+    async def cog_load(self):
+        if self.storage is None:
+            self.storage = Storage(self.bot)
+            await self.bot.add_cog(self.storage)
+
+    @discord.app_commands.command()
+    @discord.app_commands.guild_only()
+    @discord.app_commands.choices(event_type=[
+        discord.app_commands.Choice(
+            name=event_type,
+            value=event_type) for event_type in EventType])
+    async def events(self, interaction: discord.Interaction,
+                     event_type: discord.app_commands.Choice[str] = None, mine: bool = False):
+        """Lists upcoming events of this server
+
+        Args:
+            event_type (discord.app_commands.Choice[str]): Only list events of this type
+            mine (bool): Only list events you are registered for
+        """
+        filters = {'event_type': None if event_type is None else event_type.value,
+                   'user_id': interaction.user.id if mine else None}
+        content, view = self._page(interaction.guild_id, filters)
+        await interaction.response.send_message(content=content, view=view, ephemeral=True)
+
+    def _page(self, guild_id: int, filters: dict, after: tuple[int, int] | None = None,
+              before: tuple[int, int] | None = None) -> tuple[str, discord.ui.View]:
+        """Render a page of events continuing after or before a key, along with its navigation"""
+        # Fetch a single extra event to know whether there's another page in that direction
+        events = self.storage.get_event_page(guild_id, EVENTS_PER_PAGE + 1, after=after,
+                                             before=before, **filters)
+        if before is None:
+            has_previous = after is not None
+            has_next = len(events) > EVENTS_PER_PAGE
+            events = events[:EVENTS_PER_PAGE]
+        else:
+            has_previous = len(events) > EVENTS_PER_PAGE
+            has_next = True
+            events = events[-EVENTS_PER_PAGE:]
+
+        view = discord.ui.View(timeout=PAGE_TIMEOUT_SECONDS)
+        if has_previous or has_next:
+            first = (round(events[0].utc_start.timestamp()), events[0].channel_id) if events else None
+            last = (round(events[-1].utc_start.timestamp()), events[-1].channel_id) if events else None
+
+            async def previous_page(interaction: discord.Interaction):
+                content, view = self._page(guild_id, filters, before=first)
+                await interaction.response.edit_message(content=content, view=view)
+
+            async def next_page(interaction: discord.Interaction):
+                content, view = self._page(guild_id, filters, after=last)
+                await interaction.response.edit_message(content=content, view=view)
+
+            view.add_item(PageButton('Previous', previous_page, not has_previous or first is None))
+            view.add_item(PageButton('Next', next_page, not has_next or last is None))
+
+        return str(EventListMessage(events, self.bot.emojis)), view
@@ -0,0 +1,138 @@
+"""Contains the cog performing Discord side effects committed to the outbox"""
+import asyncio
+import random
+import time
+from logging import getLogger
+from typing import Awaitable, Callable
+import discord
+from discord.ext import commands, tasks
+from quickwit.models import SideEffect, SideEffectKind
+from quickwit.utils import get_env_int
+from quickwit.metrics import metrics
+from .storage import Storage
+
+DEFAULT_MAX_ATTEMPTS = 8
+DEFAULT_CONCURRENCY = 4
+BASE_BACKOFF_SECONDS = 5
+MAX_BACKOFF_SECONDS = 3600
+IDLE_POLL_SECONDS = 60
+
+SideEffectHandler = Callable[[SideEffect], Awaitable[None]]
+
+
+class Outbox(commands.Cog):
+    """Cog draining the outbox in the background, retrying failed side effects with backoff
+
+    Side effects are written in the same transaction as the state change causing them,
+    so a crash or a failing Discord API never loses them. Every kind of side effect is
+    performed by a handler registered by the cog owning it, handlers must be idempotent
+    as a side effect is attempted again when its previous attempt failed halfway.
+    Side effects of a guild are performed in order, while guilds are drained with bounded concurrency.
+    """
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.storage = self.bot.get_cog(Storage.__name__)
+        self.max_attempts = get_env_int('QUICKWIT_OUTBOX_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS)
+        self.concurrency = max(get_env_int('QUICKWIT_OUTBOX_CONCURRENCY', DEFAULT_CONCURRENCY), 1)
+        self.handlers = dict[SideEffectKind, SideEffectHandler]()
+        self._wake = asyncio.Event()
+
+    async def cog_load(self):
+        if self.storage is None:
+            self.storage = Storage(self.bot)
+            await self.bot.add_cog(self.storage)
+        metrics.register_gauge('outbox_handlers', lambda: len(self.handlers))
+        self.drain.start()
+
+    async def cog_unload(self):
+        self.drain.cancel()
+
+    def register_handler(self, kind: SideEffectKind, handler: SideEffectHandler):
+        """Perform all side effects of a kind through a handler"""
+        self.handlers[kind] = handler
+        self._wake.set()
+
+    @commands.Cog.listener()
+    async def on_outbox_updated(self):
+        """Drains side effects as soon as they are committed"""
+        self._wake.set()
+
+    @tasks.loop(seconds=0)
+    async def drain(self):
+        """Perform every due side effect, then wait until new ones are committed or become due"""
+        self._wake.clear()
+        try:
+            timeout = await self._drain_due()
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            # An unhandled error would stop the loop for good, e.g. while the database is locked
+            metrics.increment('outbox_drain_failures')
+            getLogger(__name__).warning('Failed to drain the outbox, retrying in %is: %s',
+                                        BASE_BACKOFF_SECONDS, e)
+            await asyncio.sleep(BASE_BACKOFF_SECONDS)
+            return
+
+        try:
+            await asyncio.wait_for(self._wake.wait(), timeout)
+        except TimeoutError:
+            pass
+
+    @drain.before_loop
+    async def before_drain(self):
+        """Side effects need the Discord state, wait until it's available"""
+        await self.bot.wait_until_ready()
+
+    async def _drain_due(self) -> float:
+        """Perform every due side effect, returning the seconds until the next one becomes due"""
+        # Only side effects this process can perform, those of other shards are left to their process
+        kinds = list(self.handlers)
+        shards = self.bot.owned_shards()
+        by_guild = dict[int, list[SideEffect]]()
+        for side_effect in self.storage.get_due_side_effects(kinds, shards):
+            by_guild.setdefault(side_effect.guild_id, []).append(side_effect)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def perform_guild(side_effects: list[SideEffect]):
+            async with semaphore:
+                for side_effect in side_effects:
+                    await self._perform(side_effect)
+
+        results = await asyncio.gather(*map(perform_guild, by_guild.values()), return_exceptions=True)
+        for guild_id, result in zip(by_guild, results):
+            if isinstance(result, BaseException):
+                getLogger(__name__).warning('Failed to drain the side effects of guild %i: %s',
+                                            guild_id, result, extra={'guild_id': guild_id})
+
+        next_time = self.storage.get_next_side_effect_time(kinds, shards)
+        return IDLE_POLL_SECONDS if next_time is None \
+            else min(max(next_time - time.time(), 0), IDLE_POLL_SECONDS)
+
+    async def _perform(self, side_effect: SideEffect):
+        handler = self.handlers[side_effect.kind]
+        try:
+            await handler(side_effect)
+        except (discord.NotFound, discord.Forbidden) as e:
+            # Retrying won't bring back deleted resources or missing permissions
+            metrics.increment('outbox_side_effects_dropped')
+            getLogger(__name__).warning('Dropping side effect %s: %s', side_effect.idempotency_key, e,
+                                        extra={'guild_id': side_effect.guild_id})
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            attempts = side_effect.attempts + 1
+            if attempts < self.max_attempts:
+                backoff = min(BASE_BACKOFF_SECONDS * 2 ** side_effect.attempts, MAX_BACKOFF_SECONDS)
+                metrics.increment('outbox_side_effects_retried')
+                getLogger(__name__).warning(
+                    'Side effect %s failed (%i/%i), retrying in %.0fs: %s',
+                    side_effect.idempotency_key, attempts, self.max_attempts, backoff, e,
+                    extra={'guild_id': side_effect.guild_id})
+                self.storage.defer_side_effect(
+                    side_effect.id, time.time() + backoff * random.uniform(1, 1.5), repr(e))
+                return
+
+            metrics.increment('outbox_side_effects_dropped')
+            getLogger(__name__).error('Giving up on side effect %s after %i attempts: %s',
+                                      side_effect.idempotency_key, attempts, e,
+                                      extra={'guild_id': side_effect.guild_id})
+        else:
+            metrics.increment('outbox_side_effects_performed')
+        self.storage.complete_side_effect(side_effect.id)
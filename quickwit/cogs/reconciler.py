@@ -0,0 +1,178 @@
+"""Contains the cog reconciling stored events with the state of Discord on startup"""
+import asyncio
+import time
+from dataclasses import dataclass
+from logging import getLogger
+import discord
+from discord.ext import commands
+from quickwit.utils import get_env_int
+from quickwit.metrics import metrics
+from .storage import Storage
+
+DEFAULT_CONCURRENCY = 4
+DEFAULT_SUBSCRIBER_SYNC_DELAY_MS = 500
+LIVE_STATUSES = (discord.EventStatus.scheduled, discord.EventStatus.active)
+
+
+@dataclass
+class ReconcileReport:
+    """Describes the repairs made to the events of a single guild"""
+    deleted: int = 0
+    unlinked: int = 0
+    subscribed: int = 0
+    unsubscribed: int = 0
+
+
+class Reconciler(commands.Cog):
+    """Cog repairing events whose channel or scheduled event was deleted while offline,
+        and catching up with subscribers who joined or left scheduled events meanwhile
+
+    Every guild costs one request for its channels and one for its scheduled events,
+    rather than one request per stored event. Guilds are reconciled with bounded concurrency.
+    Subscribers are streamed page by page for every live scheduled event with subscribers,
+    pausing between events so live traffic is served in between.
+    """
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.storage = self.bot.get_cog(Storage.__name__)
+        self.concurrency = max(get_env_int('QUICKWIT_RECONCILE_CONCURRENCY', DEFAULT_CONCURRENCY), 1)
+        self._lock = asyncio.Lock()
+        self._cleanups = asyncio.Semaphore(self.concurrency)
+        self.subscriber_sync_delay = get_env_int(
+            'QUICKWIT_SUBSCRIBER_SYNC_DELAY_MS', DEFAULT_SUBSCRIBER_SYNC_DELAY_MS) / 1000
+
+    async def cog_load(self):
+        if self.storage is None:
+            self.storage = Storage(self.bot)
+            await self.bot.add_cog(self.storage)
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        """Reconciles all guilds with stored events, again after every reconnect"""
+        if self._lock.locked():
+            return
+        async with self._lock:
+            await self.reconcile()
+
+    async def reconcile(self):
+        """Reconcile the events of every guild handled by this process"""
+        start = time.perf_counter()
+        guilds = [guild for guild in map(self.bot.get_guild, self.storage.get_event_guild_ids())
+                  if guild is not None and self.bot.owns_guild(guild.id)]
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def reconcile_bounded(guild: discord.Guild) -> ReconcileReport:
+            async with semaphore:
+                return await self.reconcile_guild(guild)
+
+        reports = await asyncio.gather(*map(reconcile_bounded, guilds), return_exceptions=True)
+        total = ReconcileReport()
+        for guild, report in zip(guilds, reports):
+            if isinstance(report, BaseException):
+                getLogger(__name__).warning('Failed to reconcile guild %i: %s', guild.id, report,
+                                            extra={'guild_id': guild.id})
+                continue
+            total.deleted += report.deleted
+            total.unlinked += report.unlinked
+            total.subscribed += report.subscribed
+            total.unsubscribed += report.unsubscribed
+
+        elapsed = time.perf_counter() - start
+        metrics.observe('reconcile_seconds', elapsed)
+        getLogger(__name__).info(
+            'Reconciled %i guilds in %.1fs, deleted %i and unlinked %i events, '
+            'caught up with %i new and %i former subscribers', len(guilds), elapsed,
+            total.deleted, total.unlinked, total.subscribed, total.unsubscribed)
+
+    async def reconcile_guild(self, guild: discord.Guild) -> ReconcileReport:
+        """Diff the stored events of a guild against its channels and scheduled events,
+            then catch up with the subscribers of its live scheduled events
+
+        Raises:
+            discord.HTTPException: Raised when the channels or scheduled events could not be fetched
+        """
+        # Events stored after taking this snapshot have their channels included in the fetch
+        links = self.storage.get_guild_event_links(guild.id)
+        if not links:
+            return ReconcileReport()
+
+        channel_ids = {channel.id for channel in await guild.fetch_channels()}
+        scheduled_events = {scheduled_event.id: scheduled_event
+                            for scheduled_event in await guild.fetch_scheduled_events()}
+
+        deleted = [channel_id for channel_id in links if channel_id not in channel_ids]
+        unlinked = [channel_id for channel_id, scheduled_event_id in links.items()
+                    if channel_id in channel_ids and scheduled_event_id is not None
+                    and scheduled_event_id not in scheduled_events]
+        report = ReconcileReport()
+        if deleted or unlinked:
+            events = self.storage.reconcile_events(deleted, unlinked)
+            metrics.increment('reconciled_events_deleted', len(events))
+            metrics.increment('reconciled_events_unlinked', len(unlinked))
+            report.deleted = len(events)
+            report.unlinked = len(unlinked)
+
+            # Scheduled events of deleted events are removed here, as they were fetched already
+            orphans = [scheduled_events[event.scheduled_event_id] for event in events
+                       if event.scheduled_event_id in scheduled_events]
+            if orphans:
+                await asyncio.gather(*map(self._delete_scheduled_event, orphans))
+
+            # Unlinked so the scheduled event listeners don't look for them again
+            for event in events:
+                event.scheduled_event_id = None
+                self.bot.dispatch('event_deleted', event)
+
+        for channel_id, scheduled_event_id in links.items():
+            scheduled_event = scheduled_events.get(scheduled_event_id)
+            if channel_id not in channel_ids or scheduled_event is None \
+                    or scheduled_event.status not in LIVE_STATUSES:
+                continue
+            subscribed, unsubscribed = await self.sync_subscribers(channel_id, scheduled_event)
+            report.subscribed += subscribed
+            report.unsubscribed += unsubscribed
+        return report
+
+    async def sync_subscribers(self, channel_id: int,
+                               scheduled_event: discord.ScheduledEvent) -> tuple[int, int]:
+        """Diff the subscribers of a scheduled event against the subscribers known to storage,
+            applying the difference in a single write and re-rendering the event once
+
+        Returns:
+            tuple[int, int]: The amount of new and former subscribers
+        """
+        known = self.storage.get_subscriber_ids(channel_id)
+        # Scheduled events without any subscribers don't need to be paged through
+        if not known and not scheduled_event.user_count:
+            if known is None:
+                self.storage.seed_subscribers(channel_id, [])
+            return 0, 0
+
+        subscribers = {user.id async for user in scheduled_event.users(limit=None)}
+        if known is None:
+            # Subscribers of events from before they were remembered may have left through the UI
+            # since, so they are only remembered rather than registered again
+            self.storage.seed_subscribers(channel_id, list(subscribers))
+            known = subscribers
+        added = list(subscribers - known)
+        removed = list(known - subscribers)
+        if added or removed:
+            self.storage.sync_subscribers(channel_id, added, removed)
+            metrics.increment('subscribers_caught_up', len(added) + len(removed))
+            event = self.storage.get_event(channel_id)
+            if event is not None:
+                self.bot.dispatch('registrations_altered', event)
+
+        # Yield to live traffic before paging through the next scheduled event
+        await asyncio.sleep(self.subscriber_sync_delay)
+        return len(added), len(removed)
+
+    async def _delete_scheduled_event(self, scheduled_event: discord.ScheduledEvent):
+        async with self._cleanups:
+            try:
+                await scheduled_event.delete(reason='Associated event was deleted')
+            except discord.HTTPException as e:
+                getLogger(__name__).warning(
+                    'Failed to delete scheduled event %i: %s', scheduled_event.id, e,
+                    extra={'guild_id': scheduled_event.guild_id})
@@ -2,9 +2,10 @@
 from logging import getLogger
 import discord
 from discord.ext import commands
-from quickwit.models import Status, Registration, Event
-from quickwit.utils import grab_by_id
+from quickwit.models import Status, Registration, Event, SideEffect, SideEffectKind
+from quickwit.utils import grab_by_id, get_display_name
 from .storage import Storage
+from .outbox import Outbox
 
 
 DEFAULT_IMAGE_PATH = 'resources/img/default.png'
@@ -16,16 +17,25 @@ class ScheduledEvents(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
         self.storage = self.bot.get_cog(Storage.__name__)
+        self.outbox = self.bot.get_cog(Outbox.__name__)
 
     async def cog_load(self):
         if self.storage is None:
             self.storage = Storage(self.bot)
             await self.bot.add_cog(self.storage)
+        if self.outbox is None:
+            self.outbox = Outbox(self.bot)
+            await self.bot.add_cog(self.outbox)
+        self.outbox.register_handler(SideEffectKind.CREATE_SCHEDULED_EVENT, self.create_scheduled_event)
 
     @commands.Cog.listener()
     async def on_scheduled_event_user_add(self, scheduled_event: discord.ScheduledEvent,
                                           user: discord.User):
         """Listens to a user joining a scheduled event"""
+        if not self.bot.owns_guild(scheduled_event.guild_id) \
+                or not self.storage.is_scheduled_event(scheduled_event.id):
+            return
+
         # Ensure the event is associated with an event
         event = self.storage.get_event_from_scheduled_event_id(
             scheduled_event.id)
@@ -38,22 +48,22 @@ class ScheduledEvents(commands.Cog):
             return
 
         # Attempt to get the member display name if they're part of the guild
-        member = await grab_by_id(user.id, scheduled_event.guild.get_member,
-                                  scheduled_event.guild.fetch_member)
-        name = user.display_name
-        if member is not None:
-            name = member.display_name
+        name = await get_display_name(scheduled_event.guild, user, self.bot.display_names)
 
         # Register user and notify other cogs and members
         await channel.send(f'{name} Registered through the Scheduled Event link')
         registration = Registration(user.id, Status.ATTENDING)
-        self.storage.register(event.channel_id, registration)
+        self.storage.register(event.channel_id, registration, subscriber=True)
         self.bot.dispatch('event_altered', event, None)
 
     @commands.Cog.listener()
     async def on_scheduled_event_user_remove(self, scheduled_event: discord.ScheduledEvent,
                                              user: discord.User):
         """Listens to a user leaving the scheduled event"""
+        if not self.bot.owns_guild(scheduled_event.guild_id) \
+                or not self.storage.is_scheduled_event(scheduled_event.id):
+            return
+
         # Ensure the event is associated with an event
         event = self.storage.get_event_from_scheduled_event_id(
             scheduled_event.id)
@@ -66,14 +76,10 @@ class ScheduledEvents(commands.Cog):
             return
 
         # Attempt to get the member display name if they're part of the guild
-        member = await grab_by_id(user.id, scheduled_event.guild.get_member,
-                                  scheduled_event.guild.fetch_member)
-        name = user.display_name
-        if member is not None:
-            name = member.display_name
+        name = await get_display_name(scheduled_event.guild, user, self.bot.display_names)
 
         await channel.send(f'{name} Unregistered through the Scheduled Event link')
-        self.storage.unregister(event.channel_id, user.id)
+        self.storage.unregister(event.channel_id, user.id, subscriber=True)
         self.bot.dispatch('event_altered', event, None)
 
     @commands.Cog.listener()
@@ -81,6 +87,10 @@ class ScheduledEvents(commands.Cog):
         """Remove the link between event and scheduled event,
             in case the scheduled event gets deleted
         """
+        if not self.bot.owns_guild(scheduled_event.guild_id) \
+                or not self.storage.is_scheduled_event(scheduled_event.id):
+            return
+
         event = self.storage.get_event_from_scheduled_event_id(
             scheduled_event.id)
         if event is None:
@@ -89,29 +99,33 @@ class ScheduledEvents(commands.Cog):
         event.scheduled_event_id = None
         self.storage.store_event(event)
 
-    @commands.Cog.listener()
-    async def on_event_created(self, event: Event, attachment: discord.Attachment | None):
-        """Creates an event associated with the scheduled event"""
-        if event.scheduled_event_id is not None:
+    async def create_scheduled_event(self, side_effect: SideEffect):
+        """Creates an event associated with the scheduled event,
+            linking the one a previous attempt created instead if there is one
+        """
+        event = self.storage.get_event(side_effect.payload['channel_id'])
+        if event is None or event.scheduled_event_id is not None:
             return
 
         guild = await grab_by_id(event.guild_id, self.bot.get_guild, self.bot.fetch_guild)
         if guild is None:
             return
 
-        image_bytes = None
-        if attachment is None:
-            image_bytes = discord.File(DEFAULT_IMAGE_PATH).fp.read()
-        else:
-            image_bytes = await attachment.read()
-
         location = f"<#{event.channel_id}>"
-        scheduled_event = await guild.create_scheduled_event(
-            name=event.name, start_time=event.utc_start, end_time=event.utc_end,
-            description=event.description, privacy_level=discord.PrivacyLevel.guild_only,
-            location=location, image=image_bytes, reason='Associated with an event',
-            entity_type=discord.EntityType.external
-        )
+        scheduled_event = discord.utils.get(guild.scheduled_events, location=location)
+        if scheduled_event is None:
+            image_bytes = None
+            if 'attachment_url' in side_effect.payload:
+                image_bytes = await self.bot.http.get_from_cdn(side_effect.payload['attachment_url'])
+            else:
+                image_bytes = discord.File(DEFAULT_IMAGE_PATH).fp.read()
+
+            scheduled_event = await guild.create_scheduled_event(
+                name=event.name, start_time=event.utc_start, end_time=event.utc_end,
+                description=event.description, privacy_level=discord.PrivacyLevel.guild_only,
+                location=location, image=image_bytes, reason='Associated with an event',
+                entity_type=discord.EntityType.external
+            )
         event.scheduled_event_id = scheduled_event.id
         self.storage.store_event(event)
 
@@ -121,7 +135,7 @@ class ScheduledEvents(commands.Cog):
             check whether it was associated to an event and remove it as well
         """
         # No need to remove scheduled event if it was never created
-        if event.scheduled_event_id is None:
+        if event.scheduled_event_id is None or not self.bot.owns_guild(event.guild_id):
             return
 
         guild = await grab_by_id(event.guild_id, self.bot.get_guild, self.bot.fetch_guild)
@@ -140,7 +154,7 @@ class ScheduledEvents(commands.Cog):
     @commands.Cog.listener()
     async def on_event_altered(self, event: Event, attachment: discord.Attachment | None):
         """Edits the scheduled event when an associated event is altered"""
-        if event.scheduled_event_id is None:
+        if event.scheduled_event_id is None or not self.bot.owns_guild(event.guild_id):
             return
 
         # Ensure we have access to the guild
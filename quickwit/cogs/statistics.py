@@ -0,0 +1,59 @@
+"""The statistics cog for attendance statistics"""
+import discord
+from discord.ext import commands
+from quickwit.models import UserStatistics, GuildStatistics
+from .storage import Storage
+
+
+class Statistics(commands.Cog):
+    """Cog to provide attendance statistics of users and guilds"""
+
+    stats = discord.app_commands.Group(
+        name='stats', description='Show attendance statistics', guild_only=True)
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.storage = self.bot.get_cog(Storage.__name__)
+
+    async def cog_load(self):
+        if self.storage is None:
+            self.storage = Storage(self.bot)
+            await self.bot.add_cog(self.storage)
+
+    @stats.command()
+    async def user(self, interaction: discord.Interaction, member: discord.Member | None = None):
+        """Shows how often a member attended, benched and dropped out of events
+
+        Args:
+            interaction (discord.Interaction): The Discord interaction relating to the command call
+            member (discord.Member | None): The member to show statistics of, yourself by default
+        """
+        user = member or interaction.user
+        statistics = self.storage.get_user_statistics(interaction.guild_id, user.id)
+        await interaction.response.send_message(
+            content=self._user_message(user, statistics), ephemeral=True)
+
+    @stats.command()
+    async def server(self, interaction: discord.Interaction):
+        """Shows the attendance of all events held in this server"""
+        statistics = self.storage.get_guild_statistics(interaction.guild_id)
+        await interaction.response.send_message(
+            content=self._guild_message(interaction.guild, statistics), ephemeral=True)
+
+    def _user_message(self, user: discord.abc.User, statistics: UserStatistics) -> str:
+        message = f'## Statistics of {user.mention}\n' \
+            f'Signed up for {statistics.signups} events, dropped out of {statistics.dropped}\n' \
+            f'Attended {statistics.attended} events, benched for {statistics.benched} ' \
+            f'and tentative for {statistics.tentative}'
+        if statistics.jobs:
+            message += '\n\n**Jobs played:**\n' + '\n'.join(
+                f'{job}: {plays}' for job, plays in statistics.jobs.items())
+        return message
+
+    def _guild_message(self, guild: discord.Guild, statistics: GuildStatistics) -> str:
+        average = statistics.attended / statistics.events if statistics.events else 0
+        return f'## Statistics of {guild.name}\n' \
+            f'{statistics.events} events held with {statistics.attended} attendees ' \
+            f'({average:.1f} per event) and {statistics.benched} benched\n' \
+            f'{statistics.members} members signed up {statistics.signups} times ' \
+            f'and dropped out {statistics.dropped} times'
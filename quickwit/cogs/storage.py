@@ -1,88 +1,400 @@
 """Cog to manage persistent storage"""
+import asyncio
+import fcntl
+import json
 import sqlite3
 import os
+import time
+import functools
+from contextlib import contextmanager
 from enum import StrEnum
 from logging import getLogger
 from datetime import datetime, timezone
-from discord.ext import commands
-from quickwit.models import Event, Registration, EventType
+from discord.ext import commands, tasks
+from quickwit.models import Event, EventSummary, EventType, Registration, Status, Composition, \
+    FF14Role, UserStatistics, GuildStatistics, SideEffect, SideEffectKind
+from quickwit.utils import get_env_flag, get_env_int, LRUCache
+from quickwit.metrics import metrics
 
 DATA_FOLDER_NAME = 'data'
 DATABASE_NAME = 'events.db'
 SCRIPTS_PATH = 'resources/sql'
+MIGRATIONS_PATH = f'{SCRIPTS_PATH}/migrations'
+BUSY_TIMEOUT_SECONDS = 5
+LOOP_BUSY_TIMEOUT_MS = 100
+BUSY_RETRIES = 5
+BUSY_BACKOFF_SECONDS = 0.01
+CHANGE_POLL_SECONDS = 1
+CHANGE_RETENTION_SECONDS = 3600
+DEFAULT_EVENT_CACHE_SIZE = 1000
+CACHE_EVICTION_MINUTES = 15
+VACUUM_FREE_PAGE_RATIO = 0.25
+VACUUM_PAGES_PER_STEP = 1024
+VACUUM_LOCK_SUFFIX = '.vacuum-lock'
+AUTO_VACUUM_INCREMENTAL = 2
+ATTENDED_STATUSES = f"'{Status.ATTENDING}', '{Status.LATE}'"
+
+# Statistics derived from archived events, with the columns identifying and counting them
+DERIVED_STATISTICS = {
+    'UserStats': ('guild_id, user_id', 'attended, benched, tentative'),
+    'JobStats': ('guild_id, user_id, job', 'plays'),
+    'GuildStats': ('guild_id', 'events, attended, benched, members')
+}
+
+
+def connect(database_path: str) -> sqlite3.Connection:
+    """Open a connection which can safely share the database with other processes
+
+    The connection is in autocommit mode, write transactions are started explicitly
+    """
+    conn = sqlite3.connect(database_path, timeout=BUSY_TIMEOUT_SECONDS, isolation_level=None)
+    # Only takes effect for new databases, existing ones are converted by vacuuming them once
+    conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA foreign_keys = ON')
+    return conn
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """Apply all numbered migrations newer than the database's user_version, each in its own transaction
+
+    Returns:
+        int: The schema version of the database after migrating
+    """
+    migrations = sorted((int(file.split('_')[0]), file)
+                        for file in os.listdir(MIGRATIONS_PATH) if file.endswith('.sql'))
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    for number, file in migrations:
+        if number <= version:
+            continue
+
+        with open(f'{MIGRATIONS_PATH}/{file}', 'r', encoding='utf-8') as script:
+            statements = _split_statements(script.read())
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Another process may have applied the migration while we waited for the lock
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            if number <= version:
+                conn.execute('COMMIT')
+                continue
+
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f'PRAGMA user_version = {number}')
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        version = number
+        getLogger(__name__).info('Applied database migration %s', file)
+    return version
+
+
+def _split_statements(script: str) -> list[str]:
+    """Split a script into complete statements, as executescript cannot run inside a transaction"""
+    statements = []
+    statement = ''
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            statements.append(statement.strip())
+            statement = ''
+    return statements
+
+
+def count_attendance(conn: sqlite3.Connection, condition: str, parameters: list,
+                     events_table: str = 'Events', registrations_table: str = 'Registrations'):
+    """Add the attendance of ended events to the statistics, must be called within a transaction
+
+    Args:
+        conn (sqlite3.Connection): The connection to count with
+        condition (str): Condition on the events to count, referring to the events as `e`
+        parameters (list): Parameters of the condition
+        events_table (str): Table containing the ended events
+        registrations_table (str): Table containing the registrations of the ended events
+    """
+    conn.execute(
+        f'INSERT INTO UserStats (guild_id, user_id, attended, benched, tentative) \
+            SELECT e.guild_id, r.user_id, SUM(r.status IN ({ATTENDED_STATUSES})), \
+            SUM(r.status=?), SUM(r.status=?) \
+            FROM {registrations_table} r JOIN {events_table} e USING (channel_id) \
+            WHERE {condition} GROUP BY e.guild_id, r.user_id \
+            ON CONFLICT (guild_id, user_id) DO UPDATE SET attended=attended+excluded.attended, \
+            benched=benched+excluded.benched, tentative=tentative+excluded.tentative',
+        [Status.BENCH, Status.TENTATIVE, *parameters])
+    conn.execute(
+        f'INSERT INTO JobStats (guild_id, user_id, job, plays) \
+            SELECT e.guild_id, r.user_id, r.job, COUNT(*) \
+            FROM {registrations_table} r JOIN {events_table} e USING (channel_id) \
+            WHERE {condition} AND r.job IS NOT NULL AND r.status IN ({ATTENDED_STATUSES}) \
+            GROUP BY e.guild_id, r.user_id, r.job \
+            ON CONFLICT (guild_id, user_id, job) DO UPDATE SET plays=plays+excluded.plays',
+        parameters)
+    conn.execute(
+        f'INSERT INTO GuildStats (guild_id, events, attended, benched) \
+            SELECT e.guild_id, COUNT(DISTINCT e.channel_id), \
+            COALESCE(SUM(r.status IN ({ATTENDED_STATUSES})), 0), COALESCE(SUM(r.status=?), 0) \
+            FROM {events_table} e LEFT JOIN {registrations_table} r USING (channel_id) \
+            WHERE {condition} GROUP BY e.guild_id \
+            ON CONFLICT (guild_id) DO UPDATE SET events=events+excluded.events, \
+            attended=attended+excluded.attended, benched=benched+excluded.benched',
+        [Status.BENCH, *parameters])
+
+
+def rebuild_statistics(conn: sqlite3.Connection) -> int:
+    """Recount all statistics derived from archived events, to check the counters for consistency
+
+    Signups and drops are only counted as they happen, so they are left as is.
+
+    Returns:
+        int: The amount of statistics rows which had to be corrected
+    """
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        for table, (keys, counters) in DERIVED_STATISTICS.items():
+            conn.execute(
+                f'CREATE TEMP TABLE Previous{table} AS SELECT {keys}, {counters} FROM {table}')
+
+        conn.execute('UPDATE UserStats SET attended=0, benched=0, tentative=0')
+        conn.execute('DELETE FROM JobStats')
+        conn.execute('UPDATE GuildStats SET events=0, attended=0, benched=0')
+        count_attendance(conn, 'TRUE', [], 'ArchivedEvents', 'ArchivedRegistrations')
+        conn.execute('UPDATE GuildStats SET members=(SELECT COUNT(*) FROM UserStats u \
+            WHERE u.guild_id=GuildStats.guild_id)')
+
+        corrected = 0
+        for table, (keys, counters) in DERIVED_STATISTICS.items():
+            # Rows which were changed or added, followed by rows which were removed
+            corrected += conn.execute(
+                f'SELECT COUNT(*) FROM (SELECT {keys}, {counters} FROM {table} \
+                    EXCEPT SELECT {keys}, {counters} FROM temp.Previous{table})').fetchone()[0]
+            corrected += conn.execute(
+                f'SELECT COUNT(*) FROM (SELECT {keys} FROM temp.Previous{table} \
+                    EXCEPT SELECT {keys} FROM {table})').fetchone()[0]
+            conn.execute(f'DROP TABLE temp.Previous{table}')
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        raise
+    conn.execute('COMMIT')
+    return corrected
+
+
+def retry_on_busy(method):
+    """Retry a storage write when the database is locked by another process beyond the busy timeout
+
+    Storage writes run on the event loop, so its connection only waits briefly for the lock
+    and every retry backs off for a few milliseconds, blocking the loop for well under a second.
+    """
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        for attempt in range(BUSY_RETRIES):
+            try:
+                return method(*args, **kwargs)
+            except sqlite3.OperationalError as e:
+                if e.sqlite_errorcode not in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED) \
+                        or attempt == BUSY_RETRIES - 1:
+                    raise
+                getLogger(__name__).warning('Database busy during %s, retrying (%i/%i)',
+                                            method.__name__, attempt + 1, BUSY_RETRIES)
+                time.sleep(BUSY_BACKOFF_SECONDS * 2 ** attempt)
+        return None
+    return wrapper
 
 
 class Cache:
-    """Cog for caching event storage"""
+    """Cog for caching event storage, bounded by evicting the least recently used events"""
+
+    def __init__(self, capacity: int = DEFAULT_EVENT_CACHE_SIZE):
+        self._events_cache = LRUCache[int, Event](capacity)
+
+    def __len__(self) -> int:
+        return len(self._events_cache)
 
-    def __init__(self):
-        self._events_cache = dict[int, Event]()
+    @property
+    def hits(self) -> int:
+        """Amount of events retrieved from cache"""
+        return self._events_cache.hits
+
+    @property
+    def misses(self) -> int:
+        """Amount of events which were not in cache"""
+        return self._events_cache.misses
+
+    @property
+    def evictions(self) -> int:
+        """Amount of events evicted to stay within capacity"""
+        return self._events_cache.evictions
 
     def cache_event(self, stored_event: Event):
         """Stores an event, also used to overwrite an existing event"""
-        self._events_cache[stored_event.channel_id] = stored_event
+        self._events_cache.put(stored_event.channel_id, stored_event)
 
     def uncache_event(self, channel_id: int):
         """Delete an existing event from cache"""
-        self._events_cache.pop(channel_id, None)
+        self._events_cache.pop(channel_id)
+
+    def invalidate(self, channel_id: int | None = None):
+        """Invalidate a single event, or all events when no channel ID is given"""
+        if channel_id is None:
+            self._events_cache.clear()
+        else:
+            self._events_cache.pop(channel_id)
+
+    def evict_ended(self, now: datetime) -> int:
+        """Evict all events which have ended, returning the amount of evicted events"""
+        ended = [event.channel_id for event in self._events_cache.values() if event.utc_end <= now]
+        for channel_id in ended:
+            self._events_cache.pop(channel_id)
+        return len(ended)
 
     def get_event(self, channel_id: int) -> Event | None:
         """Fetch an event based on channel ID from cache"""
-        return self._events_cache.get(channel_id, None)
+        return self._events_cache.get(channel_id)
 
     def register(self, channel_id: int, registration: Registration):
         """Ensures new registrations are added to cache"""
-        if channel_id not in self._events_cache.keys():
+        event = self._events_cache.peek(channel_id)
+        if event is None:
             return
 
-        for i, existing_registration in enumerate(self._events_cache[channel_id].registrations):
+        for i, existing_registration in enumerate(event.registrations):
             if existing_registration.user_id == registration.user_id:
-                self._events_cache[channel_id].registrations[i] = registration
+                event.registrations[i] = registration
                 return
-        self._events_cache[channel_id].registrations.append(registration)
+        event.registrations.append(registration)
+
+    def promote(self, channel_id: int, user_ids: list[int]):
+        """Ensures registrations promoted off the waitlist are no longer waitlisted in cache"""
+        event = self._events_cache.peek(channel_id)
+        if event is None or not user_ids:
+            return
+        for registration in event.registrations:
+            if registration.user_id in user_ids:
+                registration.waitlisted = False
 
     def unregister(self, channel_id: int, user_id: int):
         """Ensures registrations are removed from cache"""
-        if channel_id not in self._events_cache.keys():
+        event = self._events_cache.peek(channel_id)
+        if event is None:
             return
-        for i, existing_registration in enumerate(self._events_cache[channel_id].registrations):
+        for i, existing_registration in enumerate(event.registrations):
             if existing_registration.user_id == user_id:
-                self._events_cache[channel_id].registrations.pop(i)
+                event.registrations.pop(i)
                 return
 
 
 class NecessaryScripts(StrEnum):
     """Map all necessary scripts to filenames"""
-    CREATION = 'create'
     SET_TIMEZONE = 'insert_or_update_user_timezones'
     REGISTER_USER = 'insert_or_update_registrations'
     STORE_EVENT = 'insert_or_update_events'
+    IMPORT_EVENT = 'import_events'
+
+
+def load_scripts() -> dict[NecessaryScripts, str]:
+    """Read all necessary scripts"""
+    scripts = dict[NecessaryScripts, str]()
+    for file in os.listdir(SCRIPTS_PATH):
+        filename = file.split('.')[0]
+        if filename in NecessaryScripts:
+            with open(f'{SCRIPTS_PATH}/{file}', 'r', encoding='utf-8') as script:
+                scripts[filename] = script.read()
+    return scripts
 
 
 class Storage(commands.Cog):
     """Cog for persistent event storage"""
 
-    def __init__(self, bot: commands.Bot):
+    def __init__(self, bot: commands.Bot, database_path: str | None = None):
         self.bot = bot
-        self.cache = Cache()
-        self.conn = sqlite3.connect(os.path.join(
-            DATA_FOLDER_NAME, DATABASE_NAME))
+        self.cache = Cache(get_env_int('QUICKWIT_EVENT_CACHE_SIZE', DEFAULT_EVENT_CACHE_SIZE))
+        metrics.register_gauge('event_cache_size', lambda: len(self.cache))
+        metrics.register_gauge('event_cache_hits', lambda: self.cache.hits)
+        metrics.register_gauge('event_cache_misses', lambda: self.cache.misses)
+        metrics.register_gauge('event_cache_evictions', lambda: self.cache.evictions)
+        self.database_path = database_path or os.path.join(DATA_FOLDER_NAME, DATABASE_NAME)
+        self.conn = connect(self.database_path)
+
+        # When other processes write to the same database, changes are logged to invalidate caches
+        self.shared = get_env_flag('QUICKWIT_SHARED_STORAGE')
+        self._origin = f'{os.uname().nodename}:{os.getpid()}'
+        self._data_version = None
+        self._last_change_id = 0
 
         # Populate the scripts container with all necessary scripts
-        self.scripts = dict[NecessaryScripts, str]()
-        for file in os.listdir(SCRIPTS_PATH):
-            filename = file.split('.')[0]
-            if filename in NecessaryScripts:
-                with open(f'{SCRIPTS_PATH}/{file}', 'r', encoding='utf-8') as script:
-                    self.scripts[filename] = script.read()
+        self.scripts = load_scripts()
+
+        # Bring the schema up to date
+        migrate(self.conn)
+
+        # Another process holding the lock must not stall the event loop, only wait briefly for it
+        self.conn.execute(f'PRAGMA busy_timeout = {LOOP_BUSY_TIMEOUT_MS}')
+
+        # Known event channels and scheduled events, so unrelated gateway events are rejected
+        # without touching the database
+        self._event_channels = dict[int, int | None]()
+        self._scheduled_events = dict[int, int]()
+        for channel_id, scheduled_event_id in self.conn.execute(
+                'SELECT channel_id, scheduled_event_id FROM Events'):
+            self._track_event(channel_id, scheduled_event_id)
+        metrics.register_gauge('known_event_channels', lambda: len(self._event_channels))
+
+    async def cog_load(self):
+        self.evict_ended_events.start()
+        if self.shared:
+            self._last_change_id = self.conn.execute(
+                'SELECT COALESCE(MAX(id), 0) FROM ChangeLog').fetchone()[0]
+            self.poll_changes.start()
+            self.prune_changes.start()
+
+    async def cog_unload(self):
+        self.evict_ended_events.cancel()
+        self.poll_changes.cancel()
+        self.prune_changes.cancel()
+
+    @tasks.loop(minutes=CACHE_EVICTION_MINUTES)
+    async def evict_ended_events(self):
+        """Evict ended events from cache, they're no longer interacted with"""
+        evicted = self.cache.evict_ended(datetime.now(timezone.utc))
+        metrics.increment('event_cache_expirations', evicted)
+
+    def invalidate_event(self, channel_id: int | None = None):
+        """Drop a cached event so it's read from the database again, or all events when no ID is given"""
+        self.cache.invalidate(channel_id)
+
+    @tasks.loop(seconds=CHANGE_POLL_SECONDS)
+    async def poll_changes(self):
+        """Invalidate cached events which were changed by other processes"""
+        # The data version only changes when another connection committed
+        data_version = self.conn.execute('PRAGMA data_version').fetchone()[0]
+        if data_version == self._data_version:
+            return
+        self._data_version = data_version
+
+        changes = self.conn.execute(
+            'SELECT id, channel_id, origin FROM ChangeLog WHERE id>? ORDER BY id',
+            [self._last_change_id]).fetchall()
+        for change_id, channel_id, origin in changes:
+            self._last_change_id = change_id
+            if origin != self._origin:
+                self.cache.uncache_event(channel_id)
+                self._refresh_known_event(channel_id)
 
-        # Turn on foreign key constraints and run the creation script
-        self.conn.execute('PRAGMA foreign_keys = ON')
-        self.conn.executescript(
-            self.scripts[NecessaryScripts.CREATION])
-        self.conn.commit()
+    @tasks.loop(seconds=CHANGE_RETENTION_SECONDS)
+    async def prune_changes(self):
+        """Remove changes which all processes have long since seen"""
+        self._prune_changes()
 
-        self._modernize()
+    def is_event_channel(self, channel_id: int) -> bool:
+        """Whether a channel belongs to a stored event, without touching the database"""
+        return channel_id in self._event_channels
+
+    def is_scheduled_event(self, scheduled_event_id: int) -> bool:
+        """Whether a scheduled event belongs to a stored event, without touching the database"""
+        return scheduled_event_id in self._scheduled_events
 
     def get_timezone(self, user_id: int) -> str:
         """Fetch the timezone of a user, returning UTC on default"""
@@ -92,31 +404,43 @@ class Storage(commands.Cog):
             return 'UTC'
         return result[0]
 
-    def store_event(self, event: Event):
-        """Store an event in persistent storage"""
+    @retry_on_busy
+    def store_event(self, event: Event, side_effects: list[SideEffect] | None = None):
+        """Store an event in persistent storage, along with the side effects it causes"""
         # Convert times to timestamps
         start = round(event.utc_start.timestamp())
         end = round(event.utc_end.timestamp())
         reminder = round(event.reminder.timestamp())
+        caps = {} if event.composition is None else event.composition.caps
 
         # Store event in database
-        self.conn.execute(self.scripts[NecessaryScripts.STORE_EVENT], [
-            event.channel_id, event.event_type, event.name,
-            event.description, event.scheduled_event_id,
-            event.organiser_id, start, end, event.guild_id, reminder
-        ])
-        self.conn.commit()
+        with self._transaction():
+            self.conn.execute(self.scripts[NecessaryScripts.STORE_EVENT], [
+                event.channel_id, event.event_type, event.name,
+                event.description, event.scheduled_event_id,
+                event.organiser_id, start, end, event.guild_id, reminder,
+                caps.get(FF14Role.TANK), caps.get(FF14Role.HEALER), caps.get(FF14Role.DPS)
+            ])
+            self._record_change(event.channel_id)
+            if side_effects:
+                self._enqueue_side_effects(side_effects)
+        self._track_event(event.channel_id, event.scheduled_event_id)
+        if side_effects:
+            self.bot.dispatch('outbox_updated')
 
         # Update cache
         if self.cache is not None:
             self.cache.cache_event(event)
 
+    @retry_on_busy
     def delete_event(self, channel_id: int):
         """Deletes the event from persistent storage"""
         # Delete from database
-        self.conn.execute(
-            'DELETE FROM Events WHERE channel_id=?', [channel_id])
-        self.conn.commit()
+        with self._transaction():
+            self.conn.execute(
+                'DELETE FROM Events WHERE channel_id=?', [channel_id])
+            self._record_change(channel_id)
+        self._untrack_event(channel_id)
 
         # Delete from cache
         if self.cache is not None:
@@ -131,46 +455,54 @@ class Storage(commands.Cog):
             if cached_event is not None:
                 return cached_event
 
+        # Channels which aren't known to belong to an event are rejected without a query
+        if channel_id not in self._event_channels:
+            return None
+
         # Attempt to retrieve the event from database
-        result = self.conn.execute(
-            'SELECT event_type, name, description, scheduled_event_id, organiser_id, utc_start, \
-                utc_end, guild_id, reminder FROM Events WHERE channel_id=?',
-            [channel_id]).fetchone()
-        if result is None:
+        events = self._load_events([channel_id])
+        if not events:
             getLogger(__name__).error(
                 'Could not get event %i from database', channel_id)
             return None
 
-        # Map results to proper variables and typing
-        event_type = result[0]
-        name = result[1]
-        description = result[2]
-        scheduled_event_id = result[3]
-        organiser_id = result[4]
-        utc_start = datetime.fromtimestamp(result[5], timezone.utc)
-        utc_end = datetime.fromtimestamp(result[6], timezone.utc)
-        guild_id = result[7]
-        reminder = datetime.fromtimestamp(result[8], timezone.utc)
-        registrations = []
-
-        # Fetch registrations
-        result = self.conn.execute(
-            'SELECT user_id, status, job FROM Registrations WHERE channel_id=?',
-            [channel_id]).fetchall()
-        for row in result:
-            registrations.append(
-                Registration(row[0], row[1], row[2]))
-
-        # Create the event
-        stored_event = Event(channel_id, event_type, name, description, organiser_id,
-                             utc_start, utc_end, guild_id, reminder, registrations, scheduled_event_id)
-
         # Cache event for future reference
+        stored_event = events[0]
         if self.cache is not None and cached_event is None:
             self.cache.cache_event(stored_event)
 
         return stored_event
 
+    def _load_events(self, channel_ids: list[int]) -> list[Event]:
+        """Read events along with their registrations from the database, without caching them"""
+        placeholders = ', '.join('?' * len(channel_ids))
+        events = dict[int, Event]()
+        result = self.conn.execute(
+            f'SELECT channel_id, event_type, name, description, scheduled_event_id, organiser_id, \
+                utc_start, utc_end, guild_id, reminder, tank_cap, healer_cap, dps_cap FROM Events \
+                WHERE channel_id IN ({placeholders})', channel_ids).fetchall()
+        for row in result:
+            composition = None
+            if row[1] == EventType.FF14 and row[10] is not None:
+                composition = Composition({FF14Role.TANK: row[10], FF14Role.HEALER: row[11],
+                                           FF14Role.DPS: row[12]})
+            events[row[0]] = Event(row[0], row[1], row[2], row[3], row[5],
+                                   datetime.fromtimestamp(row[6], timezone.utc),
+                                   datetime.fromtimestamp(row[7], timezone.utc), row[8],
+                                   datetime.fromtimestamp(row[9], timezone.utc), [], row[4],
+                                   composition)
+
+        # Fetch registrations in order of registration, as waitlisted members are promoted in order
+        result = self.conn.execute(
+            f'SELECT channel_id, user_id, status, job, waitlisted FROM Registrations \
+                WHERE channel_id IN ({placeholders}) ORDER BY rowid', channel_ids).fetchall()
+        for row in result:
+            event = events[row[0]]
+            event.registrations.append(Registration(row[1], row[2], row[3], bool(row[4])))
+            if event.composition is not None:
+                event.composition.load(event.registrations[-1])
+        return list(events.values())
+
     def get_past_events(self) -> list[tuple[int, int, int]]:
         """Retrieve all channel IDs from events that have ended
 
@@ -183,41 +515,459 @@ class Storage(commands.Cog):
             'SELECT channel_id, scheduled_event_id, guild_id FROM Events WHERE utc_end<=?', [end])
         return [(row[0], row[1], row[2]) for row in result.fetchall()]
 
-    def get_active_reminders(self) -> list[int]:
-        """Retrieve all channel IDs for events that can have their reminder be sent out"""
+    @retry_on_busy
+    def archive_events(self, channel_ids: list[int]) -> list[Event]:
+        """Move events and their registrations into the archive within a single transaction
+
+        Returns:
+            list[Event]: The archived events as they were before archiving
+        """
+        events = self._load_events(channel_ids)
+        placeholders = ', '.join('?' * len(channel_ids))
+        with self._transaction():
+            # Members who never made it off the waitlist were benched, whatever they signed up as
+            self.conn.execute(
+                f'UPDATE Registrations SET status=? WHERE waitlisted=1 AND channel_id IN ({placeholders})',
+                [Status.BENCH, *channel_ids])
+            self.conn.execute(
+                f'INSERT OR REPLACE INTO ArchivedEvents (channel_id, event_type, name, organiser_id, \
+                    utc_start, utc_end, guild_id) SELECT channel_id, event_type, name, organiser_id, \
+                    utc_start, utc_end, guild_id FROM Events WHERE channel_id IN ({placeholders})',
+                channel_ids)
+            self.conn.execute(
+                f'INSERT OR REPLACE INTO ArchivedRegistrations (channel_id, user_id, job, status) \
+                    SELECT channel_id, user_id, job, status FROM Registrations \
+                    WHERE channel_id IN ({placeholders})', channel_ids)
+
+            count_attendance(self.conn, f'e.channel_id IN ({placeholders})', channel_ids)
+
+            # Registrations and other event data are removed along with the event
+            self.conn.execute(f'DELETE FROM Events WHERE channel_id IN ({placeholders})', channel_ids)
+            for channel_id in channel_ids:
+                self._record_change(channel_id)
+
+        for channel_id in channel_ids:
+            self.cache.uncache_event(channel_id)
+            self._untrack_event(channel_id)
+        return events
+
+    async def optimize(self):
+        """Refresh query planner statistics and release free pages once a large part of the database
+            is unused
+
+        Pages are released incrementally, so every step only holds the write lock for a moment,
+        and only one of the processes sharing the database releases them.
+        """
+        try:
+            self.conn.execute('PRAGMA optimize')
+
+            page_count = self.conn.execute('PRAGMA page_count').fetchone()[0]
+            free_pages = self.conn.execute('PRAGMA freelist_count').fetchone()[0]
+            if page_count == 0 or free_pages / page_count < VACUUM_FREE_PAGE_RATIO:
+                return
+            if self.conn.execute('PRAGMA auto_vacuum').fetchone()[0] != AUTO_VACUUM_INCREMENTAL:
+                getLogger(__name__).warning(
+                    '%i of %i pages are free, run `python -m quickwit.cli vacuum` while the bot is '
+                    'stopped to release them', free_pages, page_count)
+                return
+
+            with open(f'{self.database_path}{VACUUM_LOCK_SUFFIX}', 'w', encoding='utf-8') as lock:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return
+
+                getLogger(__name__).info('Releasing %i of %i database pages', free_pages, page_count)
+                while free_pages > 0:
+                    # The pragma releases a page per returned row, so all rows must be fetched
+                    self.conn.execute(f'PRAGMA incremental_vacuum({VACUUM_PAGES_PER_STEP})').fetchall()
+                    remaining = self.conn.execute('PRAGMA freelist_count').fetchone()[0]
+                    if remaining >= free_pages:
+                        break
+                    free_pages = remaining
+                    await asyncio.sleep(0)
+        except sqlite3.OperationalError as e:
+            getLogger(__name__).warning('Failed to optimize the database: %s', e)
+
+    def get_event_page(self, guild_id: int, limit: int, after: tuple[int, int] | None = None,
+                       before: tuple[int, int] | None = None, event_type: str | None = None,
+                       user_id: int | None = None) -> list[EventSummary]:
+        """Fetch a page of a guild's events which have yet to end, ordered by start
+
+        Pages are continued from the (utc_start, channel_id) key of the last or first listed event,
+        so every page is a single bounded range read of the guild's timeline.
+
+        Args:
+            guild_id (int): The guild to list events of
+            limit (int): The maximum amount of events to fetch
+            after (tuple[int, int] | None): Only fetch events ordered after this key
+            before (tuple[int, int] | None): Only fetch events ordered before this key,
+                being the last events before it
+            event_type (str | None): Only fetch events of this type
+            user_id (int | None): Only fetch events this user is registered for
+
+        Returns:
+            list[EventSummary]: The events, ordered by start
+        """
+        conditions = ['e.guild_id=?', 'e.utc_end>?']
+        parameters = [guild_id, round(datetime.now().timestamp())]
+        if after is not None:
+            conditions.append('(e.utc_start, e.channel_id)>(?, ?)')
+            parameters.extend(after)
+        if before is not None:
+            conditions.append('(e.utc_start, e.channel_id)<(?, ?)')
+            parameters.extend(before)
+        if event_type is not None:
+            conditions.append('e.event_type=?')
+            parameters.append(event_type)
+        if user_id is not None:
+            conditions.append(
+                'e.channel_id IN (SELECT channel_id FROM Registrations WHERE user_id=?)')
+            parameters.append(user_id)
+
+        order = 'DESC' if before is not None else 'ASC'
+        result = self.conn.execute(
+            f'SELECT e.channel_id, e.event_type, e.name, e.utc_start, \
+                (SELECT COUNT(*) FROM Registrations r WHERE r.channel_id=e.channel_id) \
+                FROM Events e WHERE {' AND '.join(conditions)} \
+                ORDER BY e.utc_start {order}, e.channel_id {order} LIMIT ?',
+            [*parameters, limit]).fetchall()
+        if before is not None:
+            result.reverse()
+        return [EventSummary(row[0], row[1], row[2], datetime.fromtimestamp(row[3], timezone.utc),
+                             row[4]) for row in result]
+
+    def get_active_reminders(self) -> list[tuple[int, int]]:
+        """Retrieve all events that can have their reminder be sent out
+
+        Returns:
+            list[tuple[int, int]]: A list of tuples consisting of channel_id and guild_id
+        """
         now = round(datetime.now().timestamp())
         results = self.conn.execute(
-            'SELECT channel_id FROM Events WHERE utc_start>? AND reminder<?', [now, now]).fetchall()
-        return [result[0] for result in results]
+            'SELECT channel_id, guild_id FROM Events WHERE utc_start>? AND reminder<?',
+            [now, now]).fetchall()
+        return [(result[0], result[1]) for result in results]
 
     def get_event_from_scheduled_event_id(self, scheduled_event_id: int) -> Event | None:
         """Return whether the scheduled event is associated with a stored event"""
-        result = self.conn.execute('SELECT channel_id FROM Events WHERE scheduled_event_id=?',
-                                   [scheduled_event_id]).fetchone()
-        if result is None:
+        channel_id = self._scheduled_events.get(scheduled_event_id)
+        if channel_id is None:
             return None
-        return self.get_event(result[0])
+        return self.get_event(channel_id)
 
+    @retry_on_busy
     def update_timezone(self, user_id: int, user_timezone: str):
         """Set a users timezone"""
-        self.conn.execute(
-            self.scripts[NecessaryScripts.SET_TIMEZONE], [user_id, user_timezone])
-        self.conn.commit()
+        with self._transaction():
+            self.conn.execute(
+                self.scripts[NecessaryScripts.SET_TIMEZONE], [user_id, user_timezone])
 
-    def register(self, channel_id: int, registration: Registration):
-        """Store a new registration"""
-        self.conn.execute(self.scripts[NecessaryScripts.REGISTER_USER],
-                          [channel_id, registration.user_id, registration.job,
-                           str(registration.status)])
-        self.conn.commit()
+    @retry_on_busy
+    def register(self, channel_id: int, registration: Registration,
+                 subscriber: bool = False) -> list[int]:
+        """Store a new registration, benching it onto the waitlist when the event has no room for it
+
+        Args:
+            channel_id (int): The event to register to
+            registration (Registration): The registration to store
+            subscriber (bool): Whether the user registered by subscribing to the scheduled event,
+                which is remembered along with the registration
+
+        Returns:
+            list[int]: The ID of every waitlisted user promoted into a seat freed by the registration
+        """
+        event = self.get_event(channel_id)
+        composition = None if event is None else event.composition
+        promoted = []
+        try:
+            if composition is not None:
+                composition.register(registration)
+                promoted = composition.promote()
+
+            with self._transaction():
+                existing = self.conn.execute(
+                    'SELECT 1 FROM Registrations WHERE channel_id=? AND user_id=?',
+                    [channel_id, registration.user_id]).fetchone()
+                self.conn.execute(self.scripts[NecessaryScripts.REGISTER_USER],
+                                  [channel_id, registration.user_id, registration.job,
+                                   str(registration.status), registration.waitlisted])
+                if existing is None:
+                    self._count_registration(channel_id, registration.user_id, 'signups')
+                if subscriber:
+                    self.conn.execute('INSERT OR IGNORE INTO ScheduledEventSubscribers \
+                        (channel_id, user_id) VALUES (?, ?)', [channel_id, registration.user_id])
+                self._store_promotions(channel_id, promoted)
+                self._record_change(channel_id)
+        except BaseException:
+            # The composition no longer matches storage, rebuild it when the event is read again
+            self.cache.uncache_event(channel_id)
+            raise
         self.cache.register(channel_id, registration)
+        self.cache.promote(channel_id, promoted)
+        return promoted
 
-    def unregister(self, channel_id: int, user_id: int):
-        """Remove a registration from storage"""
-        self.conn.execute(
-            'DELETE FROM Registrations WHERE channel_id=? AND user_id=?', [channel_id, user_id])
-        self.conn.commit()
+    @retry_on_busy
+    def unregister(self, channel_id: int, user_id: int, subscriber: bool = False) -> list[int]:
+        """Remove a registration from storage
+
+        Args:
+            channel_id (int): The event to unregister from
+            user_id (int): The user to unregister
+            subscriber (bool): Whether the user unregistered by unsubscribing from the scheduled event,
+                which is forgotten along with the registration
+
+        Returns:
+            list[int]: The ID of every waitlisted user promoted into the seat freed by the user
+        """
+        event = self.get_event(channel_id)
+        composition = None if event is None else event.composition
+        promoted = []
+        try:
+            if composition is not None:
+                composition.unregister(user_id)
+                promoted = composition.promote()
+
+            with self._transaction():
+                deleted = self.conn.execute(
+                    'DELETE FROM Registrations WHERE channel_id=? AND user_id=?',
+                    [channel_id, user_id]).rowcount
+                if deleted > 0:
+                    self._count_registration(channel_id, user_id, 'dropped')
+                if subscriber:
+                    self.conn.execute('DELETE FROM ScheduledEventSubscribers \
+                        WHERE channel_id=? AND user_id=?', [channel_id, user_id])
+                self._store_promotions(channel_id, promoted)
+                self._record_change(channel_id)
+        except BaseException:
+            self.cache.uncache_event(channel_id)
+            raise
         self.cache.unregister(channel_id, user_id)
+        self.cache.promote(channel_id, promoted)
+        return promoted
+
+    @retry_on_busy
+    def set_composition(self, channel_id: int, caps: dict[FF14Role, int] | None) \
+            -> tuple[list[int], list[int]]:
+        """Cap the amount of members per role of an event, or remove the caps when None
+
+        Returns:
+            tuple[list[int], list[int]]: The ID of every waitlisted user promoted into a seat the
+                new caps made room for, and of every seated user benched as the new caps are exceeded
+        """
+        try:
+            with self._transaction():
+                caps = caps or {}
+                self.conn.execute(
+                    'UPDATE Events SET tank_cap=?, healer_cap=?, dps_cap=? WHERE channel_id=?',
+                    [caps.get(FF14Role.TANK), caps.get(FF14Role.HEALER), caps.get(FF14Role.DPS),
+                     channel_id])
+
+                # Rebuild the composition from storage under the new caps
+                self.cache.uncache_event(channel_id)
+                event = self.get_event(channel_id)
+                if event is None:
+                    return [], []
+                waitlisted = {registration.user_id for registration in event.registrations
+                              if registration.waitlisted}
+                if event.composition is None:
+                    promoted = list(waitlisted)
+                    benched = []
+                else:
+                    # Seat everyone anew in order of registration, benching whoever exceeds the caps
+                    event.composition = Composition(event.composition.caps)
+                    for registration in event.registrations:
+                        event.composition.register(registration)
+                    promoted = [user_id for user_id in waitlisted
+                                if user_id in event.composition.seats]
+                    benched = [user_id for user_id in event.composition.waitlist
+                               if user_id not in waitlisted]
+
+                self._store_promotions(channel_id, promoted)
+                self.conn.executemany(
+                    'UPDATE Registrations SET waitlisted=1 WHERE channel_id=? AND user_id=?',
+                    [(channel_id, user_id) for user_id in benched])
+                self._record_change(channel_id)
+        except BaseException:
+            self.cache.uncache_event(channel_id)
+            raise
+        self.cache.promote(channel_id, promoted)
+        return promoted, benched
+
+    def get_calendar_events(self, guild_id: int, user_id: int | None = None) -> list[Event]:
+        """Fetch all events of a guild which have not been archived, without their registrations
+
+        Args:
+            guild_id (int): The guild to fetch events of
+            user_id (int | None): Only fetch events this user is registered for
+        """
+        query = 'SELECT channel_id, event_type, name, description, organiser_id, utc_start, utc_end, \
+            reminder, scheduled_event_id FROM Events WHERE guild_id=?'
+        parameters = [guild_id]
+        if user_id is not None:
+            query += ' AND channel_id IN (SELECT channel_id FROM Registrations WHERE user_id=?)'
+            parameters.append(user_id)
+        result = self.conn.execute(f'{query} ORDER BY utc_start', parameters).fetchall()
+        return [Event(row[0], row[1], row[2], row[3], row[4],
+                      datetime.fromtimestamp(row[5], timezone.utc),
+                      datetime.fromtimestamp(row[6], timezone.utc), guild_id,
+                      datetime.fromtimestamp(row[7], timezone.utc), [], row[8]) for row in result]
+
+    def get_overlapping_event_ids(self, user_id: int, channel_id: int, utc_start: datetime,
+                                  utc_end: datetime) -> list[int]:
+        """Fetch the ID of all other events the user is registered to which overlap the given period
+
+        The user's registrations are found through their index and each event through its key,
+        so the check never loads or compares full events.
+        """
+        result = self.conn.execute(
+            'SELECT e.channel_id FROM Registrations r JOIN Events e USING (channel_id) \
+                WHERE r.user_id=? AND r.channel_id!=? AND e.utc_start<? AND e.utc_end>? \
+                ORDER BY e.utc_start',
+            [user_id, channel_id, round(utc_end.timestamp()), round(utc_start.timestamp())])
+        return [row[0] for row in result.fetchall()]
+
+    def get_user_statistics(self, guild_id: int, user_id: int) -> UserStatistics:
+        """Fetch the attendance statistics of a user within a guild"""
+        statistics = UserStatistics(user_id)
+        result = self.conn.execute(
+            'SELECT signups, dropped, attended, benched, tentative FROM UserStats \
+                WHERE guild_id=? AND user_id=?', [guild_id, user_id]).fetchone()
+        if result is not None:
+            (statistics.signups, statistics.dropped, statistics.attended,
+             statistics.benched, statistics.tentative) = result
+
+        result = self.conn.execute(
+            'SELECT job, plays FROM JobStats WHERE guild_id=? AND user_id=? ORDER BY plays DESC',
+            [guild_id, user_id]).fetchall()
+        statistics.jobs = dict(result)
+        return statistics
+
+    def get_guild_statistics(self, guild_id: int) -> GuildStatistics:
+        """Fetch the attendance statistics of all events within a guild"""
+        statistics = GuildStatistics(guild_id)
+        result = self.conn.execute(
+            'SELECT events, signups, dropped, attended, benched, members FROM GuildStats \
+                WHERE guild_id=?', [guild_id]).fetchone()
+        if result is not None:
+            (statistics.events, statistics.signups, statistics.dropped,
+             statistics.attended, statistics.benched, statistics.members) = result
+        return statistics
+
+    def get_event_role_name(self, guild_id: int) -> str | None:
+        """Fetch the name of the role mentioned by events in a guild, None when not configured"""
+        result = self.conn.execute('SELECT event_role_name FROM GuildSettings WHERE guild_id=?',
+                                   [guild_id]).fetchone()
+        return None if result is None else result[0]
+
+    @retry_on_busy
+    def set_event_role_name(self, guild_id: int, name: str | None):
+        """Set the name of the role mentioned by events in a guild, None to reset it"""
+        with self._transaction():
+            self.conn.execute(
+                'INSERT INTO GuildSettings (guild_id, event_role_name) VALUES (?, ?) \
+                    ON CONFLICT(guild_id) DO UPDATE SET event_role_name=excluded.event_role_name',
+                [guild_id, name])
+
+    def get_subscriber_ids(self, channel_id: int) -> set[int] | None:
+        """Fetch the ID of every user known to have subscribed to the scheduled event of an event,
+            None when its subscribers have yet to be seeded
+        """
+        result = self.conn.execute('SELECT subscribers_known FROM Events WHERE channel_id=?',
+                                   [channel_id]).fetchone()
+        if result is None or not result[0]:
+            return None
+        result = self.conn.execute(
+            'SELECT user_id FROM ScheduledEventSubscribers WHERE channel_id=?', [channel_id])
+        return {row[0] for row in result.fetchall()}
+
+    @retry_on_busy
+    def seed_subscribers(self, channel_id: int, user_ids: list[int]):
+        """Remember the current subscribers of an event whose subscribers were unknown, without
+            registering them
+        """
+        with self._transaction():
+            self.conn.executemany('INSERT OR IGNORE INTO ScheduledEventSubscribers (channel_id, user_id) \
+                VALUES (?, ?)', [(channel_id, user_id) for user_id in user_ids])
+            self.conn.execute('UPDATE Events SET subscribers_known=1 WHERE channel_id=?', [channel_id])
+
+    @retry_on_busy
+    def sync_subscribers(self, channel_id: int, added: list[int], removed: list[int]) -> list[int]:
+        """Register subscribers who are not registered yet and unregister former subscribers,
+            all within a single transaction
+
+        Returns:
+            list[int]: The ID of every waitlisted user promoted into a freed seat
+        """
+        event = self.get_event(channel_id)
+        if event is None:
+            return []
+        registered = {registration.user_id for registration in event.registrations}
+        registrations = [Registration(user_id, Status.ATTENDING) for user_id in added
+                         if user_id not in registered]
+        unregistered = [user_id for user_id in removed if user_id in registered]
+
+        composition = event.composition
+        promoted = []
+        try:
+            if composition is not None:
+                for user_id in unregistered:
+                    composition.unregister(user_id)
+                for registration in registrations:
+                    composition.register(registration)
+                promoted = composition.promote()
+
+            with self._transaction():
+                self.conn.executemany(self.scripts[NecessaryScripts.REGISTER_USER], [
+                    (channel_id, registration.user_id, registration.job, str(registration.status),
+                     registration.waitlisted) for registration in registrations])
+                self.conn.executemany('DELETE FROM Registrations WHERE channel_id=? AND user_id=?',
+                                      [(channel_id, user_id) for user_id in unregistered])
+                for registration in registrations:
+                    self._count_registration(channel_id, registration.user_id, 'signups')
+                for user_id in unregistered:
+                    self._count_registration(channel_id, user_id, 'dropped')
+
+                self.conn.executemany('INSERT OR IGNORE INTO ScheduledEventSubscribers \
+                    (channel_id, user_id) VALUES (?, ?)', [(channel_id, user_id) for user_id in added])
+                self.conn.executemany('DELETE FROM ScheduledEventSubscribers \
+                    WHERE channel_id=? AND user_id=?', [(channel_id, user_id) for user_id in removed])
+                self._store_promotions(channel_id, promoted)
+                self._record_change(channel_id)
+        except BaseException:
+            self.cache.uncache_event(channel_id)
+            raise
+        for registration in registrations:
+            self.cache.register(channel_id, registration)
+        for user_id in unregistered:
+            self.cache.unregister(channel_id, user_id)
+        self.cache.promote(channel_id, promoted)
+        return promoted
+
+    def get_pending_selection(self, user_id: int, channel_id: int, max_age: float) \
+            -> tuple[str | None, str | None] | None:
+        """Fetch the status and job a user selected for an event, if selected at most max_age seconds ago"""
+        return self.conn.execute(
+            'SELECT status, job FROM PendingSelections WHERE user_id=? AND channel_id=? AND updated_at>?',
+            [user_id, channel_id, round(time.time() - max_age)]).fetchone()
+
+    @retry_on_busy
+    def store_pending_selection(self, user_id: int, channel_id: int,
+                                status: str | None, job: str | None):
+        """Store the status and job a user selected for an event, before having joined"""
+        with self._transaction():
+            self.conn.execute(
+                'INSERT INTO PendingSelections (user_id, channel_id, status, job, updated_at) \
+                    VALUES (?, ?, ?, ?, ?) ON CONFLICT(user_id, channel_id) DO UPDATE SET \
+                    status=excluded.status, job=excluded.job, updated_at=excluded.updated_at',
+                [user_id, channel_id, status, job, round(time.time())])
+
+    @retry_on_busy
+    def prune_pending_selections(self, max_age: float):
+        """Remove all selections made more than max_age seconds ago"""
+        with self._transaction():
+            self.conn.execute('DELETE FROM PendingSelections WHERE updated_at<=?',
+                              [round(time.time() - max_age)])
 
     def get_registered_event_ids(self, user_id: int) -> list[int]:
         """Fetch the ID of all events where the user is registered to"""
@@ -225,12 +975,170 @@ class Storage(commands.Cog):
                                    [user_id])
         return [row[0] for row in result.fetchall()]
 
-    def _modernize(self):
-        """Old versions of this bot used differing event_type names, ensure they're modernized"""
-        self.conn.execute('UPDATE Events SET event_type=? WHERE event_type=?',
-                          [EventType.FF14, 'FF14Event'])
-        self.conn.execute('UPDATE Events SET event_type=? WHERE event_type=?',
-                          [EventType.FASHION, 'FashionShow'])
-        self.conn.execute('UPDATE Events SET event_type=? WHERE event_type=?',
-                          [EventType.CAMPFIRE, 'CampfireEvent'])
-        self.conn.commit()
+    def get_event_guild_ids(self) -> list[int]:
+        """Fetch the ID of all guilds with stored events"""
+        result = self.conn.execute('SELECT DISTINCT guild_id FROM Events')
+        return [row[0] for row in result.fetchall()]
+
+    def get_guild_event_links(self, guild_id: int) -> dict[int, int | None]:
+        """Fetch the channel IDs of all events of a guild along with their scheduled event IDs"""
+        result = self.conn.execute(
+            'SELECT channel_id, scheduled_event_id FROM Events WHERE guild_id=?', [guild_id])
+        return {row[0]: row[1] for row in result.fetchall()}
+
+    @retry_on_busy
+    def reconcile_events(self, deleted_channel_ids: list[int],
+                         unlinked_channel_ids: list[int]) -> list[Event]:
+        """Delete events whose channel is gone and unlink events whose scheduled event is gone,
+            all within a single transaction
+
+        Returns:
+            list[Event]: The deleted events as they were before deleting
+        """
+        events = [event for event in map(self.get_event, deleted_channel_ids) if event is not None]
+        with self._transaction():
+            self.conn.executemany('DELETE FROM Events WHERE channel_id=?',
+                                  [(channel_id,) for channel_id in deleted_channel_ids])
+            self.conn.executemany('UPDATE Events SET scheduled_event_id=NULL WHERE channel_id=?',
+                                  [(channel_id,) for channel_id in unlinked_channel_ids])
+            for channel_id in deleted_channel_ids + unlinked_channel_ids:
+                self._record_change(channel_id)
+
+        for channel_id in deleted_channel_ids:
+            self.cache.uncache_event(channel_id)
+            self._untrack_event(channel_id)
+        for channel_id in unlinked_channel_ids:
+            self.cache.uncache_event(channel_id)
+            self._refresh_known_event(channel_id)
+        return events
+
+    def get_due_side_effects(self, kinds: list[SideEffectKind],
+                             shards: tuple[int, list[int]] | None = None) -> list[SideEffect]:
+        """Fetch all side effects whose next attempt is due, in the order they were committed
+
+        Args:
+            kinds (list[SideEffectKind]): Only fetch side effects of these kinds
+            shards (tuple[int, list[int]] | None): The shard count and the shards to fetch the
+                side effects of guilds of, None to fetch those of all guilds
+        """
+        condition, parameters = self._side_effect_condition(kinds, shards)
+        result = self.conn.execute(
+            f'SELECT id, kind, idempotency_key, guild_id, payload, attempts FROM Outbox \
+                WHERE available_at<=? AND {condition} ORDER BY id', [round(time.time()), *parameters])
+        return [SideEffect(SideEffectKind(row[1]), row[2], row[3], json.loads(row[4]), row[0], row[5])
+                for row in result.fetchall()]
+
+    def get_next_side_effect_time(self, kinds: list[SideEffectKind],
+                                  shards: tuple[int, list[int]] | None = None) -> float | None:
+        """Seconds since epoch at which the next side effect of the given kinds and shards is due,
+            None when there are none
+        """
+        condition, parameters = self._side_effect_condition(kinds, shards)
+        return self.conn.execute(
+            f'SELECT MIN(available_at) FROM Outbox WHERE {condition}', parameters).fetchone()[0]
+
+    @staticmethod
+    def _side_effect_condition(kinds: list[SideEffectKind],
+                               shards: tuple[int, list[int]] | None) -> tuple[str, list]:
+        """Build the condition selecting side effects of the given kinds and shards"""
+        condition = f'kind IN ({", ".join("?" * len(kinds))})'
+        parameters = list(kinds)
+        if shards is not None:
+            shard_count, shard_ids = shards
+            # Discord assigns guilds to shards by the timestamp bits of their ID
+            condition += f' AND (guild_id >> 22) % ? IN ({", ".join("?" * len(shard_ids))})'
+            parameters += [shard_count, *shard_ids]
+        return condition, parameters
+
+    @retry_on_busy
+    def complete_side_effect(self, side_effect_id: int):
+        """Remove a side effect which was performed or given up on"""
+        with self._transaction():
+            self.conn.execute('DELETE FROM Outbox WHERE id=?', [side_effect_id])
+
+    @retry_on_busy
+    def defer_side_effect(self, side_effect_id: int, available_at: float, error: str):
+        """Count a failed attempt at a side effect and schedule its next attempt"""
+        with self._transaction():
+            self.conn.execute(
+                'UPDATE Outbox SET attempts=attempts+1, available_at=?, last_error=? WHERE id=?',
+                [round(available_at), error, side_effect_id])
+
+    @contextmanager
+    def _transaction(self):
+        """Run the enclosed statements in a single write transaction"""
+        # Take the write lock up front, upgrading a read transaction cannot wait for the lock
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except BaseException:
+            if self.conn.in_transaction:
+                self.conn.execute('ROLLBACK')
+            raise
+        self.conn.execute('COMMIT')
+
+    def _track_event(self, channel_id: int, scheduled_event_id: int | None):
+        """Remember a stored event, replacing the scheduled event it was previously linked to"""
+        previous_scheduled_event_id = self._event_channels.get(channel_id)
+        if previous_scheduled_event_id is not None:
+            self._scheduled_events.pop(previous_scheduled_event_id, None)
+        self._event_channels[channel_id] = scheduled_event_id
+        if scheduled_event_id is not None:
+            self._scheduled_events[scheduled_event_id] = channel_id
+
+    def _untrack_event(self, channel_id: int):
+        """Forget a deleted or archived event"""
+        scheduled_event_id = self._event_channels.pop(channel_id, None)
+        if scheduled_event_id is not None:
+            self._scheduled_events.pop(scheduled_event_id, None)
+
+    def _refresh_known_event(self, channel_id: int):
+        """Track or forget an event changed by another process"""
+        result = self.conn.execute(
+            'SELECT scheduled_event_id FROM Events WHERE channel_id=?', [channel_id]).fetchone()
+        if result is None:
+            self._untrack_event(channel_id)
+        else:
+            self._track_event(channel_id, result[0])
+
+    def _store_promotions(self, channel_id: int, user_ids: list[int]):
+        """Move promoted users off the waitlist keeping their status, must be called within a transaction"""
+        self.conn.executemany(
+            'UPDATE Registrations SET waitlisted=0 WHERE channel_id=? AND user_id=?',
+            [(channel_id, user_id) for user_id in user_ids])
+
+    def _count_registration(self, channel_id: int, user_id: int, counter: str):
+        """Increment a registration counter of both the user and the guild of an event"""
+        self.conn.execute(
+            f'INSERT INTO UserStats (guild_id, user_id, {counter}) \
+                SELECT guild_id, ?, 1 FROM Events WHERE channel_id=? \
+                ON CONFLICT (guild_id, user_id) DO UPDATE SET {counter}={counter}+1',
+            [user_id, channel_id])
+        self.conn.execute(
+            f'INSERT INTO GuildStats (guild_id, {counter}) \
+                SELECT guild_id, 1 FROM Events WHERE channel_id=? \
+                ON CONFLICT (guild_id) DO UPDATE SET {counter}={counter}+1',
+            [channel_id])
+
+    def _enqueue_side_effects(self, side_effects: list[SideEffect]):
+        """Add side effects to the outbox, must be called within a transaction"""
+        now = round(time.time())
+        self.conn.executemany(
+            'INSERT OR IGNORE INTO Outbox (idempotency_key, kind, guild_id, payload, available_at) \
+                VALUES (?, ?, ?, ?, ?)',
+            [(side_effect.idempotency_key, str(side_effect.kind), side_effect.guild_id,
+              json.dumps(side_effect.payload), now) for side_effect in side_effects])
+
+    def _record_change(self, channel_id: int):
+        """Log a change to an event so other processes sharing the database invalidate it"""
+        if not self.shared:
+            return
+        self.conn.execute('INSERT INTO ChangeLog (channel_id, origin, changed_at) VALUES (?, ?, ?)',
+                          [channel_id, self._origin, round(time.time())])
+
+    @retry_on_busy
+    def _prune_changes(self):
+        """Remove changes which all processes have long since seen"""
+        with self._transaction():
+            self.conn.execute('DELETE FROM ChangeLog WHERE changed_at<?',
+                              [round(time.time()) - CHANGE_RETENTION_SECONDS])
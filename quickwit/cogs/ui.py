@@ -1,15 +1,72 @@
 """Contains the cog for handling registrations, as well as the necessary UI elements"""
+import hashlib
+import io
+import sqlite3
 from typing import TypeAlias
 from logging import getLogger
 import discord
 from discord.ext import commands
-from quickwit.utils import get_event_role, grab_by_id
+from quickwit.utils import grab_by_id, get_env_flag, get_env_int, LRUCache
 from quickwit.views import JoinButton, LeaveButton, StatusSelect, JobSelect, EventMessage
-from quickwit.models import Status, JobT, Registration, Event, EventType, JOB_EVENT_JOB_TYPE_MAP
+from quickwit.models import Status, JobT, Registration, Event, EventType, JOB_EVENT_JOB_TYPE_MAP, \
+    SideEffect, SideEffectKind
+from quickwit.metrics import metrics
 from .storage import Storage
+from .event_role import EventRole
+from .outbox import Outbox
 
 RegistrationData: TypeAlias = tuple[Status | None, JobT | None]
 DEFAULT_IMAGE_PATH = 'resources/img/default.png'
+DISCUSSION_THREAD_NAME = 'Discussion'
+DEFAULT_SELECTION_CACHE_SIZE = 10000
+DEFAULT_SELECTION_TTL_HOURS = 24
+DEFAULT_RENDER_CACHE_SIZE = 10000
+HEADER_MESSAGE = 0
+BODY_MESSAGE = 1
+
+
+class SelectionStore:
+    """Bounded store of the status and job users selected before joining an event,
+        optionally persisted so selections survive restarts
+    """
+
+    def __init__(self, storage: Storage, maxsize: int, ttl: float, persist: bool):
+        self.storage = storage
+        self.ttl = ttl
+        self.persist = persist
+        self._selections = LRUCache[tuple[int, int], RegistrationData](maxsize, ttl)
+
+    def __len__(self) -> int:
+        return len(self._selections)
+
+    def get(self, user_id: int, channel_id: int) -> RegistrationData:
+        """Get the selection of a user for an event, defaulting to nothing selected"""
+        selection = self._selections.get((user_id, channel_id))
+        if selection is None and self.persist:
+            selection = self.storage.get_pending_selection(user_id, channel_id, self.ttl)
+            if selection is not None:
+                self._selections.put((user_id, channel_id), selection)
+        if selection is None:
+            return (None, None)
+        return selection
+
+    def put(self, user_id: int, channel_id: int, selection: RegistrationData):
+        """Store the selection of a user for an event"""
+        self._selections.put((user_id, channel_id), selection)
+        if not self.persist:
+            return
+        try:
+            self.storage.store_pending_selection(user_id, channel_id, *selection)
+        except sqlite3.IntegrityError:
+            getLogger(__name__).warning(
+                'Not persisting selection for channel %i without an event', channel_id,
+                extra={'channel_id': channel_id, 'user_id': user_id})
+
+    def drop_channel(self, channel_id: int):
+        """Drop all selections for an event, persisted selections are removed along with the event"""
+        for key in self._selections.keys():
+            if key[1] == channel_id:
+                self._selections.pop(key)
 
 
 class UI(commands.Cog):
@@ -18,7 +75,11 @@ class UI(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
         self.storage = self.bot.get_cog(Storage.__name__)
-        self.registration_data = dict[int, dict[int, RegistrationData]]()
+        self.event_roles = self.bot.get_cog(EventRole.__name__)
+        self.outbox = self.bot.get_cog(Outbox.__name__)
+        self.selections = None
+        self.rendered = LRUCache[tuple[int, int], tuple[bytes, int | None]](
+            get_env_int('QUICKWIT_RENDER_CACHE_SIZE', DEFAULT_RENDER_CACHE_SIZE))
         self.event_type_view_map = dict[EventType, discord.ui.View]()
 
         # Right now we're taking the bot's ID as the prefix to persistent UI elements
@@ -41,22 +102,44 @@ class UI(commands.Cog):
         if self.storage is None:
             self.storage = Storage(self.bot)
             await self.bot.add_cog(self.storage)
+        if self.event_roles is None:
+            self.event_roles = EventRole(self.bot)
+            await self.bot.add_cog(self.event_roles)
+        if self.outbox is None:
+            self.outbox = Outbox(self.bot)
+            await self.bot.add_cog(self.outbox)
+        self.outbox.register_handler(SideEffectKind.POST_EVENT_MESSAGES, self.post_event_messages)
+
+        ttl = get_env_int('QUICKWIT_SELECTION_TTL_HOURS', DEFAULT_SELECTION_TTL_HOURS) * 3600
+        self.selections = SelectionStore(
+            self.storage, get_env_int('QUICKWIT_SELECTION_CACHE_SIZE', DEFAULT_SELECTION_CACHE_SIZE),
+            ttl, get_env_flag('QUICKWIT_PERSIST_SELECTIONS'))
+        if self.selections.persist:
+            self.storage.prune_pending_selections(ttl)
+        metrics.register_gauge('pending_selections', lambda: len(self.selections))
+        metrics.register_gauge('rendered_message_cache_size', lambda: len(self.rendered))
+
+    async def post_event_messages(self, side_effect: SideEffect):
+        """Sends messages in the newly created event channel to represent the event and it's UI,
+            skipping messages which a previous attempt sent already
+        """
+        event = self.storage.get_event(side_effect.payload['channel_id'])
+        if event is None:
+            return
 
-    @commands.Cog.listener()
-    async def on_event_created(self, event: Event, attachment: discord.Attachment | None):
-        """Sends messages in the newly created event channel to represent the event and it's UI"""
         # Ensure the guild exists
         guild = await grab_by_id(event.guild_id, self.bot.get_guild, self.bot.fetch_guild)
         if guild is None:
             getLogger(__name__).warning(
-                'Could not find guild %i', event.guild_id)
+                'Could not find guild %i', event.guild_id, extra={'guild_id': event.guild_id})
             return
 
         # Ensure the channel exists within the guild
         channel = await grab_by_id(event.channel_id, guild.get_channel, guild.fetch_channel)
         if channel is None:
             getLogger(__name__).warning(
-                'Could not find channel %i within guild %i', event.channel_id, guild.id)
+                'Could not find channel %i within guild %i', event.channel_id, guild.id,
+                extra={'guild_id': guild.id, 'channel_id': event.channel_id})
             return
 
         # Grab the view corresponding to the event type
@@ -67,55 +150,67 @@ class UI(commands.Cog):
             return
 
         # Send the event creation messages
-        event_role = await get_event_role(guild)
+        event_role = await self.event_roles.get_role(guild)
         event_representation = EventMessage(
             event, self.bot.emojis, event_role)
-        file = None
-        if attachment is None:
+        header = event_representation.header_message()
+        body = event_representation.body_message()
+        attachment = None
+        if 'attachment_id' in side_effect.payload:
+            attachment = discord.Object(side_effect.payload['attachment_id'])
+
+        sent = [message async for message in channel.history(limit=2, oldest_first=True)
+                if message.author.id == self.bot.user.id]
+        if len(sent) < 1:
             file = discord.File(DEFAULT_IMAGE_PATH)
-        if attachment is not None:
-            file = await attachment.to_file()
-        await channel.send(content=event_representation.header_message(), file=file)
-        await channel.send(content=event_representation.body_message(), view=view)
-        await channel.create_thread(name='Discussion', type=discord.ChannelType.public_thread,
-                                    auto_archive_duration=10080)
+            if attachment is not None:
+                image = await self.bot.http.get_from_cdn(side_effect.payload['attachment_url'])
+                file = discord.File(io.BytesIO(image), side_effect.payload['attachment_filename'])
+            await channel.send(content=header, file=file)
+        if len(sent) < 2:
+            await channel.send(content=body, view=view)
+        if not any(thread.name == DISCUSSION_THREAD_NAME for thread in channel.threads):
+            await channel.create_thread(name=DISCUSSION_THREAD_NAME,
+                                        type=discord.ChannelType.public_thread,
+                                        auto_archive_duration=10080)
+        self.rendered.put((event.channel_id, HEADER_MESSAGE),
+                          (self._digest(header), None if attachment is None else attachment.id))
+        self.rendered.put((event.channel_id, BODY_MESSAGE), (self._digest(body), None))
 
     @commands.Cog.listener()
     async def on_event_altered(self, event: Event, attachment: discord.Attachment | None):
         """Upates message representations of events on alteration"""
-        messages = await self._grab_creation_messages(event.channel_id)
-        if messages is None:
-            return
-
         # Ensure the guild exists
         guild = await grab_by_id(event.guild_id, self.bot.get_guild, self.bot.fetch_guild)
         if guild is None:
             return
 
         # Edit the event creation messages
-        event_role = await get_event_role(guild)
+        event_role = await self.event_roles.get_role(guild)
         event_message = EventMessage(event, self.bot.emojis, event_role)
-        if attachment is not None:
-            await messages[0].edit(attachments=[attachment])
-        await messages[0].edit(content=event_message.header_message())
-        await messages[1].edit(content=event_message.body_message())
+        await self._edit_creation_messages(
+            event.channel_id, event_message.header_message(), event_message.body_message(),
+            attachment)
 
     @commands.Cog.listener()
     async def on_registrations_altered(self, event: Event):
         """Updates body message with new registrations"""
-        messages = await self._grab_creation_messages(event.channel_id)
-        if messages is None:
-            return
-
         # Ensure the guild exists
         guild = await grab_by_id(event.guild_id, self.bot.get_guild, self.bot.fetch_guild)
         if guild is None:
             return
 
         # Edit the event creation messages
-        event_role = await get_event_role(guild)
+        event_role = await self.event_roles.get_role(guild)
         event_message = EventMessage(event, self.bot.emojis, event_role).body_message()
-        await messages[1].edit(content=event_message)
+        await self._edit_creation_messages(event.channel_id, None, event_message)
+
+    @commands.Cog.listener()
+    async def on_event_deleted(self, event: Event):
+        """Drops selections made for and messages rendered of the deleted event"""
+        self.selections.drop_channel(event.channel_id)
+        self.rendered.pop((event.channel_id, HEADER_MESSAGE))
+        self.rendered.pop((event.channel_id, BODY_MESSAGE))
 
     @discord.app_commands.command()
     async def refresh_ui(self, interaction: discord.Interaction):
@@ -135,9 +230,8 @@ class UI(commands.Cog):
         await messages[1].edit(view=view)
 
     async def _join_callback(self, interaction: discord.Interaction):
-        # Ensure there is registration data to edit
-        registration = self._ensure_existing_registration(
-            interaction.user.id, interaction.channel_id)
+        # Grab the status and job selected so far
+        registration = self.selections.get(interaction.user.id, interaction.channel_id)
 
         # Attendance status is required
         if registration[0] is None:
@@ -166,6 +260,21 @@ class UI(commands.Cog):
         # Inform the other cogs of the registration
         self.bot.dispatch('registrations_altered', event)
 
+        if registration.waitlisted:
+            await interaction.followup.send(
+                content='The party has no room for your role, you were benched onto the waitlist '
+                'and will be promoted once a spot opens up',
+                ephemeral=True)
+
+        # Warn about other events the user can't attend at the same time
+        overlapping = self.storage.get_overlapping_event_ids(
+            interaction.user.id, event.channel_id, event.utc_start, event.utc_end)
+        if overlapping:
+            channels = ', '.join(f'<#{channel_id}>' for channel_id in overlapping)
+            await interaction.followup.send(
+                content=f'Heads up, this event overlaps with other events you joined: {channels}',
+                ephemeral=True)
+
     async def _leave_callback(self, interaction: discord.Interaction):
         # Make sure event exists
         event = self.storage.get_event(interaction.channel_id)
@@ -198,26 +307,60 @@ class UI(commands.Cog):
         self.bot.dispatch('registrations_altered', event)
 
     async def _status_callback(self, interaction: discord.Interaction, status: Status):
-        registration = self._ensure_existing_registration(
-            interaction.user.id, interaction.channel_id)
-        self.registration_data[interaction.user.id][interaction.channel_id] = (
-            status, registration[1])
+        registration = self.selections.get(interaction.user.id, interaction.channel_id)
+        self.selections.put(interaction.user.id, interaction.channel_id,
+                            (status, registration[1]))
         await interaction.response.defer()
 
     async def _job_callback(self, interaction: discord.Interaction, job: JobT):
-        registration = self._ensure_existing_registration(
-            interaction.user.id, interaction.channel_id)
-        self.registration_data[interaction.user.id][interaction.channel_id] = (
-            registration[0], job)
+        registration = self.selections.get(interaction.user.id, interaction.channel_id)
+        self.selections.put(interaction.user.id, interaction.channel_id,
+                            (registration[0], job))
         await interaction.response.defer()
 
-    def _ensure_existing_registration(self, user_id: int, channel_id: int) -> RegistrationData:
-        if self.registration_data.get(user_id, None) is None:
-            self.registration_data[user_id] = {}
+    async def _edit_creation_messages(self, channel_id: int, header: str | None, body: str,
+                                      attachment: discord.Attachment | None = None):
+        """Edit the event creation messages, skipping messages whose rendering did not change
+
+        The digest of the last rendering of every message is kept along with the ID of its
+        attachment, so unchanged messages are neither fetched nor edited. A new attachment is
+        edited along with the header, an edit without one keeps the current attachment.
+        """
+        edits = dict[int, tuple[str, discord.Attachment | None, bytes]]()
+        if header is not None:
+            edits[HEADER_MESSAGE] = (header, attachment, self._digest(header))
+        edits[BODY_MESSAGE] = (body, None, self._digest(body))
+        for index, (_, new_attachment, digest) in list(edits.items()):
+            rendered = self.rendered.get((channel_id, index))
+            if rendered is not None and rendered[0] == digest \
+                    and (new_attachment is None or new_attachment.id == rendered[1]):
+                metrics.increment('message_edits_suppressed')
+                del edits[index]
+        if not edits:
+            return
+
+        messages = await self._grab_creation_messages(channel_id)
+        if messages is None:
+            return
 
-        if self.registration_data[user_id].get(channel_id, None) is None:
-            self.registration_data[user_id][channel_id] = (None, None)
-        return self.registration_data[user_id][channel_id]
+        for index, (content, new_attachment, digest) in edits.items():
+            message = messages[index]
+            rendered = self.rendered.get((channel_id, index))
+            attachment_id = None if rendered is None else rendered[1]
+            # Unknown renderings, e.g. after a restart, are compared against the message itself
+            if new_attachment is None and message.content == content:
+                metrics.increment('message_edits_suppressed')
+            elif new_attachment is None:
+                await message.edit(content=content)
+            else:
+                await message.edit(content=content, attachments=[new_attachment])
+                attachment_id = new_attachment.id
+            self.rendered.put((channel_id, index), (digest, attachment_id))
+
+    @staticmethod
+    def _digest(content: str) -> bytes:
+        """Digest the content of a rendered message, small enough to keep for many messages"""
+        return hashlib.blake2b(content.encode(), digest_size=16).digest()
 
     async def _grab_creation_messages(self, channel_id: int) \
             -> tuple[discord.Message, discord.Message] | None:
@@ -0,0 +1,103 @@
+"""Provides the aggregation of errors into periodic digests for the admin"""
+import asyncio
+import time
+import traceback
+from dataclasses import dataclass
+from logging import getLogger
+from typing import Awaitable, Callable
+from quickwit.metrics import metrics
+
+DEFAULT_WINDOW_MINUTES = 15
+DEFAULT_SIGNATURE_TTL_HOURS = 24
+MESSAGE_LIMIT = 2000
+SAMPLE_TRACEBACK_LENGTH = 1200
+
+Signature = tuple[str, str]
+
+
+@dataclass
+class ErrorGroup:
+    """Errors sharing a signature within the current window"""
+    count: int
+    sample: str
+
+
+class ErrorDigest:
+    """Groups errors by event method and exception type, sending one digest per window
+
+    Errors of a signature not seen within the last `signature_ttl` are sent immediately,
+    repeated errors are only counted and reported with a sample traceback once the window ends.
+    """
+
+    def __init__(self, send: Callable[[str], Awaitable[None]],
+                 window_minutes: float = DEFAULT_WINDOW_MINUTES,
+                 signature_ttl_hours: float = DEFAULT_SIGNATURE_TTL_HOURS):
+        self.send = send
+        self.window = window_minutes * 60
+        self.signature_ttl = signature_ttl_hours * 3600
+        self._groups = dict[Signature, ErrorGroup]()
+        self._seen = dict[Signature, float]()
+        self._task = None
+
+    def start(self):
+        """Start sending digests, must be called from within the event loop"""
+        self._task = asyncio.create_task(self._send_periodically())
+
+    async def stop(self):
+        """Stop sending digests, sending the pending one"""
+        if self._task is not None:
+            self._task.cancel()
+        await self.flush()
+
+    async def record(self, event_method: str, error: BaseException):
+        """Record an error, sending it right away when its signature is new"""
+        signature = (event_method, type(error).__qualname__)
+        metrics.increment('errors')
+        now = time.monotonic()
+        seen_at = self._seen.get(signature)
+        self._seen[signature] = now
+        if seen_at is None or now - seen_at >= self.signature_ttl:
+            await self._send(f'New error during execution of {event_method}:\n'
+                             f'```\n{self._format(error)}\n```')
+            return
+
+        group = self._groups.get(signature)
+        if group is None:
+            self._groups[signature] = ErrorGroup(1, self._format(error))
+        else:
+            group.count += 1
+
+    async def flush(self):
+        """Send a digest of the errors recorded since the last digest, if any"""
+        if not self._groups:
+            return
+        groups, self._groups = self._groups, {}
+
+        total = sum(group.count for group in groups.values())
+        lines = [f'{total} repeated errors in the last {self.window / 60:.0f} minutes:']
+        ordered = sorted(groups.items(), key=lambda item: -item[1].count)
+        for (event_method, error_type), group in ordered:
+            lines.append(f'- {group.count}x {error_type} in {event_method}')
+        (_, error_type), top = ordered[0]
+        lines.append(f'Sample {error_type}:\n```\n{top.sample}\n```')
+        await self._send('\n'.join(lines))
+
+    async def _send_periodically(self):
+        while True:
+            await asyncio.sleep(self.window)
+            await self.flush()
+
+    async def _send(self, content: str):
+        if len(content) > MESSAGE_LIMIT:
+            content = content[:MESSAGE_LIMIT - 4] + '\n```'
+        try:
+            await self.send(content)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            getLogger(__name__).warning('Failed to send error digest: %s', e)
+
+    @staticmethod
+    def _format(error: BaseException) -> str:
+        formatted = ''.join(traceback.format_exception(error))
+        if len(formatted) > SAMPLE_TRACEBACK_LENGTH:
+            formatted = '...' + formatted[-SAMPLE_TRACEBACK_LENGTH:]
+        return formatted
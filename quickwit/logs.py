@@ -0,0 +1,155 @@
+"""Provides quickwit's logging setup, formatting and writing records off the event loop"""
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from quickwit.utils import get_env_int
+from quickwit.metrics import metrics
+
+LOGGER_NAMES = ('quickwit', 'discord')
+TEXT_FORMAT = '\x1b[30;1m%(asctime)s\x1b[0m %(levelname)-8s\x1b[0m \x1b[35m%(name)s\x1b[0m %(message)s'
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+CONTEXT_FIELDS = ('guild_id', 'channel_id', 'user_id')
+DEFAULT_SAMPLE_RATE = 10
+CONTEXT_SOURCES = {
+    'guild_id': ('guild_id', 'guild'),
+    'channel_id': ('channel_id', 'channel'),
+    'user_id': ('user_id', 'user', 'author')
+}
+
+# The IDs of the event or interaction being handled, inherited by the tasks handling it
+log_context = ContextVar[dict[str, int] | None]('log_context', default=None)
+
+
+def context_of(*objects) -> dict[str, int]:
+    """Collect the guild, channel and user IDs carried by objects, e.g. the arguments of an event
+
+    An ID is taken from the first object carrying it, either as an ID attribute
+    or as the ID of the referenced Discord object.
+    """
+    context = dict[str, int]()
+    for obj in objects:
+        for name, attributes in CONTEXT_SOURCES.items():
+            if name in context:
+                continue
+            for attribute in attributes:
+                value = getattr(obj, attribute, None)
+                value = value if attribute == name else getattr(value, 'id', None)
+                if isinstance(value, int) and not isinstance(value, bool):
+                    context[name] = value
+                    break
+    return context
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as single line JSON objects, including the guild, channel and user IDs
+        passed through `extra` or taken from the `log_context`
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        for name in CONTEXT_FIELDS:
+            value = getattr(record, name, None)
+            if value is not None:
+                entry[name] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry)
+
+
+class ContextFilter(logging.Filter):
+    """Adds the IDs of the current `log_context` to records, unless they were passed through `extra`"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = log_context.get()
+        if context:
+            for name, value in context.items():
+                if getattr(record, name, None) is None:
+                    setattr(record, name, value)
+        return True
+
+
+class RecordQueueHandler(logging.handlers.QueueHandler):
+    """Enqueues records with their message merged, but unlike its base keeps the traceback
+        separate so formatters can still place it themselves
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+
+class SamplingFilter(logging.Filter):
+    """Lets only one of every `rate` info records through for records logged with
+        `extra={'sampled': True}`, counted separately per logger and message
+    """
+
+    def __init__(self, rate: int):
+        super().__init__()
+        self.rate = max(rate, 1)
+        self._counts = dict[tuple[str, str], int]()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.INFO or not getattr(record, 'sampled', False):
+            return True
+
+        key = (record.name, str(record.msg))
+        count = self._counts.get(key, 0)
+        self._counts[key] = count + 1
+        if count % self.rate == 0:
+            if count > 0:
+                record.msg = f'{record.msg} (sampled 1 of {self.rate})'
+            return True
+        metrics.increment('log_records_sampled')
+        return False
+
+
+def setup_logging() -> logging.handlers.QueueListener:
+    """Route quickwit's and discord.py's records through a queue to a background thread writing them
+
+    Logging only enqueues records on the calling thread, so a slow stdout never blocks the loop.
+    Set `QUICKWIT_LOG_FORMAT=json` to write one JSON object per line.
+
+    Returns:
+        logging.handlers.QueueListener: The started listener, stopped on exit to flush remaining records
+    """
+    handler = logging.StreamHandler(sys.stderr)
+    if os.getenv('QUICKWIT_LOG_FORMAT', '').strip().lower() == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(TEXT_FORMAT, DATE_FORMAT))
+
+    records = queue.SimpleQueue()
+    queue_handler = RecordQueueHandler(records)
+    # Handler filters run in the logging task before enqueueing, where its context is still set
+    queue_handler.addFilter(ContextFilter())
+    queue_handler.addFilter(SamplingFilter(
+        get_env_int('QUICKWIT_LOG_SAMPLE_RATE', DEFAULT_SAMPLE_RATE)))
+    for name in LOGGER_NAMES:
+        logger = logging.getLogger(name)
+        logger.setLevel(logging.INFO)
+        logger.handlers = [queue_handler]
+        logger.propagate = False
+
+    listener = logging.handlers.QueueListener(records, handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
@@ -0,0 +1,49 @@
+"""Provides a minimal in-process metrics registry"""
+from dataclasses import dataclass
+from typing import Callable
+
+
+@dataclass
+class Summary:
+    """Aggregated observations of a single metric"""
+    count: int = 0
+    total: float = 0.0
+    maximum: float = 0.0
+
+
+class Metrics:
+    """Registry of counters, summaries and gauges, rendered on demand"""
+
+    def __init__(self):
+        self.counters = dict[str, int]()
+        self.summaries = dict[str, Summary]()
+        self.gauges = dict[str, Callable[[], float]]()
+
+    def increment(self, name: str, amount: int = 1):
+        """Increase a counter"""
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name: str, value: float):
+        """Record a single observation, such as a duration"""
+        summary = self.summaries.setdefault(name, Summary())
+        summary.count += 1
+        summary.total += value
+        summary.maximum = max(summary.maximum, value)
+
+    def register_gauge(self, name: str, getter: Callable[[], float]):
+        """Register a callable which is evaluated whenever metrics are rendered"""
+        self.gauges[name] = getter
+
+    def render(self) -> str:
+        """Render all metrics as plain text, one per line"""
+        lines = [f'{name} {value}' for name, value in sorted(self.counters.items())]
+        for name, summary in sorted(self.summaries.items()):
+            lines.append(f'{name}_count {summary.count}')
+            lines.append(f'{name}_total {summary.total:.6f}')
+            lines.append(f'{name}_max {summary.maximum:.6f}')
+        for name, getter in sorted(self.gauges.items()):
+            lines.append(f'{name} {getter()}')
+        return '\n'.join(lines)
+
+
+metrics = Metrics()
@@ -1,4 +1,7 @@
 """Contains all models to represent and act on throughout the rest of the application"""
-from .event import Event, EventType, JOB_EVENT_JOB_TYPE_MAP
+from .event import Event, EventSummary, EventType, JOB_EVENT_JOB_TYPE_MAP
 from .registration import Registration, Status
-from .jobs import JobT, FF14Job, FashionShowJob, CampfireEventJob
+from .composition import Composition, SEATED_STATUSES
+from .jobs import JobT, FF14Job, FF14Role, FF14_JOB_ROLE_MAP, FashionShowJob, CampfireEventJob
+from .statistics import UserStatistics, GuildStatistics
+from .side_effect import SideEffect, SideEffectKind
@@ -0,0 +1,99 @@
+"""Contains all models necessary for capped party compositions"""
+from collections import deque
+from .jobs import FF14Role, FF14_JOB_ROLE_MAP
+from .registration import Registration, Status
+
+SEATED_STATUSES = (Status.ATTENDING, Status.LATE)
+
+
+class Composition:
+    """Represents the role caps of an event, along with counters of the seats taken per role
+
+    Flexible members, registered as Allrounder or without a job, may fill any role.
+    Another member of a role therefore fits as long as both that role and the party have room,
+    allowing every join and leave to be decided in constant time.
+    Members who don't fit are benched onto a waitlist, queued per role in order of registration,
+    keeping the status they signed up with for when they are promoted.
+    """
+
+    def __init__(self, caps: dict[FF14Role, int]):
+        self.caps = caps
+        self.size = sum(caps.values())
+        self.seated = 0
+        self.counts = dict[FF14Role | None, int]()
+        self.seats = dict[int, FF14Role | None]()
+        self.waitlist = dict[int, tuple[int, FF14Role | None]]()
+        self._queues = dict[FF14Role | None, deque[tuple[int, int]]]()
+        self._sequence = 0
+
+    def fits(self, role: FF14Role | None) -> bool:
+        """Whether a member of a role, or a flexible member when None, can be seated"""
+        if self.seated >= self.size:
+            return False
+        return role is None or self.counts.get(role, 0) < self.caps[role]
+
+    def load(self, registration: Registration):
+        """Account for a stored registration as is, registrations must be loaded in order"""
+        role = FF14_JOB_ROLE_MAP.get(registration.job)
+        if registration.waitlisted:
+            self._enqueue(registration.user_id, role)
+        elif registration.status in SEATED_STATUSES:
+            self._seat(registration.user_id, role)
+
+    def register(self, registration: Registration):
+        """Seat a new or changed registration, benching it onto the waitlist when its role is full"""
+        self.unregister(registration.user_id)
+        registration.waitlisted = False
+        if registration.status not in SEATED_STATUSES:
+            return
+
+        role = FF14_JOB_ROLE_MAP.get(registration.job)
+        if self.fits(role):
+            self._seat(registration.user_id, role)
+        else:
+            registration.waitlisted = True
+            self._enqueue(registration.user_id, role)
+
+    def unregister(self, user_id: int):
+        """Free the seat or waitlist spot taken by a user"""
+        role = self.seats.pop(user_id, False)
+        if role is not False:
+            self.counts[role] -= 1
+            self.seated -= 1
+        # Queued spots are dropped lazily once they reach the front of their queue
+        self.waitlist.pop(user_id, None)
+
+    def promote(self) -> list[int]:
+        """Seat the earliest waitlisted members who fit, until no one else does
+
+        Returns:
+            list[int]: The ID of every promoted user
+        """
+        promoted = []
+        while True:
+            earliest = None
+            for role, queue in self._queues.items():
+                if not self.fits(role):
+                    continue
+                while queue and self.waitlist.get(queue[0][1]) != (queue[0][0], role):
+                    queue.popleft()
+                if queue and (earliest is None or queue[0][0] < earliest[0][0]):
+                    earliest = (queue[0], role)
+            if earliest is None:
+                return promoted
+
+            (_, user_id), role = earliest
+            self._queues[role].popleft()
+            del self.waitlist[user_id]
+            self._seat(user_id, role)
+            promoted.append(user_id)
+
+    def _seat(self, user_id: int, role: FF14Role | None):
+        self.seats[user_id] = role
+        self.counts[role] = self.counts.get(role, 0) + 1
+        self.seated += 1
+
+    def _enqueue(self, user_id: int, role: FF14Role | None):
+        self._sequence += 1
+        self.waitlist[user_id] = (self._sequence, role)
+        self._queues.setdefault(role, deque()).append((self._sequence, user_id))
@@ -3,6 +3,7 @@ from dataclasses import dataclass
 from datetime import datetime
 from enum import StrEnum
 from .registration import Registration
+from .composition import Composition
 from .jobs import FF14Job, FashionShowJob, CampfireEventJob
 
 
@@ -35,3 +36,14 @@ class Event:
     reminder: datetime
     registrations: list[Registration]
     scheduled_event_id: int | None = None
+    composition: Composition | None = None
+
+
+@dataclass
+class EventSummary:
+    """Represents an Event as listed among other events"""
+    channel_id: int
+    event_type: EventType
+    name: str
+    utc_start: datetime
+    registrations: int
@@ -41,6 +41,42 @@ class FF14Job(StrEnum):
     # OFF_TANK = 'Off Tank'
 
 
+class FF14Role(StrEnum):
+    """Party roles filled by FF14 jobs"""
+    TANK = 'Tank'
+    HEALER = 'Healer'
+    DPS = 'DPS'
+
+
+# Jobs without a role, such as Allrounder, are flexible and may fill any role
+FF14_JOB_ROLE_MAP = {
+    FF14Job.TANK: FF14Role.TANK,
+    FF14Job.WAR: FF14Role.TANK,
+    FF14Job.PLD: FF14Role.TANK,
+    FF14Job.DRK: FF14Role.TANK,
+    FF14Job.GNB: FF14Role.TANK,
+    FF14Job.HEALER: FF14Role.HEALER,
+    FF14Job.WHM: FF14Role.HEALER,
+    FF14Job.SCH: FF14Role.HEALER,
+    FF14Job.AST: FF14Role.HEALER,
+    FF14Job.SGE: FF14Role.HEALER,
+    FF14Job.DPS: FF14Role.DPS,
+    FF14Job.MNK: FF14Role.DPS,
+    FF14Job.DRG: FF14Role.DPS,
+    FF14Job.NIN: FF14Role.DPS,
+    FF14Job.SAM: FF14Role.DPS,
+    FF14Job.VPR: FF14Role.DPS,
+    FF14Job.RPR: FF14Role.DPS,
+    FF14Job.BRD: FF14Role.DPS,
+    FF14Job.MCH: FF14Role.DPS,
+    FF14Job.DNC: FF14Role.DPS,
+    FF14Job.BLM: FF14Role.DPS,
+    FF14Job.SMN: FF14Role.DPS,
+    FF14Job.RDM: FF14Role.DPS,
+    FF14Job.PCT: FF14Role.DPS
+}
+
+
 class FashionShowJob(StrEnum):
     """Jobs available to fashion shows"""
     CROWD = 'Crowd'
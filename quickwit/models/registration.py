@@ -18,3 +18,4 @@ class Registration:
     user_id: int
     status: Status
     job: JobT | None = None
+    waitlisted: bool = False
@@ -0,0 +1,24 @@
+"""Contains all models necessary for the transactional outbox"""
+from dataclasses import dataclass, field
+from enum import StrEnum
+
+
+class SideEffectKind(StrEnum):
+    """Enumerates the Discord side effects performed through the outbox"""
+    POST_EVENT_MESSAGES = 'post_event_messages'
+    CREATE_SCHEDULED_EVENT = 'create_scheduled_event'
+
+
+@dataclass
+class SideEffect:
+    """Represents a Discord side effect committed along with the state change causing it
+
+    The idempotency key identifies the side effect, so handlers can tell whether a previous
+    attempt got as far as Discord before failing.
+    """
+    kind: SideEffectKind
+    idempotency_key: str
+    guild_id: int
+    payload: dict = field(default_factory=dict)
+    id: int | None = None
+    attempts: int = 0
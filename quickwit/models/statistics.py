@@ -0,0 +1,26 @@
+"""Contains all models necessary for attendance statistics"""
+from dataclasses import dataclass, field
+
+
+@dataclass
+class UserStatistics:
+    """Represents the attendance of a single user within a guild"""
+    user_id: int
+    signups: int = 0
+    dropped: int = 0
+    attended: int = 0
+    benched: int = 0
+    tentative: int = 0
+    jobs: dict[str, int] = field(default_factory=dict)
+
+
+@dataclass
+class GuildStatistics:
+    """Represents the attendance of all events within a guild"""
+    guild_id: int
+    events: int = 0
+    signups: int = 0
+    dropped: int = 0
+    attended: int = 0
+    benched: int = 0
+    members: int = 0
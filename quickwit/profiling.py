@@ -0,0 +1,189 @@
+"""Provides opt-in instrumentation of cog handlers, Storage and Discord API calls"""
+import asyncio
+import cProfile
+import functools
+import inspect
+import io
+import pstats
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from logging import getLogger
+from typing import Any, Callable
+import discord
+from discord.ext import commands, tasks
+
+DEFAULT_SLOW_CALL_THRESHOLD_MS = 500
+CDN_ROUTE = 'CDN'
+
+
+@dataclass
+class CallTiming:
+    """Time spent during a single handler invocation, in seconds"""
+    storage: float = 0.0
+    discord: float = 0.0
+    discord_routes: dict[str, float] = field(default_factory=dict)
+    in_storage: bool = False
+
+
+@dataclass
+class HandlerStatistics:
+    """Aggregated timings of a single handler, in seconds"""
+    calls: int = 0
+    slow_calls: int = 0
+    total: float = 0.0
+    maximum: float = 0.0
+    storage: float = 0.0
+    discord: float = 0.0
+
+
+_current_call = ContextVar[CallTiming | None]('current_call', default=None)
+
+
+class Profiler:
+    """Wraps cog handlers to record wall time and time spent in Storage versus awaiting Discord"""
+
+    def __init__(self, slow_call_threshold_ms: float = DEFAULT_SLOW_CALL_THRESHOLD_MS):
+        self.slow_call_threshold = slow_call_threshold_ms / 1000
+        self.statistics = dict[str, HandlerStatistics]()
+        self._profile_lock = asyncio.Lock()
+
+    def instrument_cog(self, cog: commands.Cog):
+        """Wrap all app commands, listeners and task loops of a cog, must be called before it's added"""
+        cog_name = cog.__cog_name__
+
+        for event_name, method_name in cog.__cog_listeners__:
+            handler = getattr(cog, method_name)
+            setattr(cog, method_name, self._wrap_handler(
+                f'{cog_name}.{method_name} ({event_name})', handler))
+
+        for command in cog.walk_app_commands():
+            if isinstance(command, discord.app_commands.Command):
+                callback = command._callback  # pylint: disable=protected-access
+                command._callback = self._wrap_handler(  # pylint: disable=protected-access
+                    f'{cog_name}./{command.qualified_name}', callback)
+
+        for attribute_name, attribute in vars(type(cog)).items():
+            if isinstance(attribute, tasks.Loop):
+                # Accessing the loop through the instance creates the copy bound to this cog
+                loop = getattr(cog, attribute_name)
+                loop.coro = self._wrap_handler(f'{cog_name}.{attribute_name} (loop)', loop.coro)
+
+    def instrument_storage(self, storage: commands.Cog):
+        """Wrap all public Storage methods so their time is attributed to the running handler"""
+        for name, attribute in vars(type(storage)).items():
+            if name.startswith('_') or not inspect.isfunction(attribute) \
+                    or inspect.iscoroutinefunction(attribute):
+                continue
+            setattr(storage, name, self._wrap_storage(getattr(storage, name)))
+
+    def instrument_http(self, http: discord.http.HTTPClient):
+        """Wrap the Discord HTTP client so REST and CDN time is attributed to the running handler"""
+        request = http.request
+        get_from_cdn = http.get_from_cdn
+
+        @functools.wraps(request)
+        async def timed_request(route: discord.http.Route, *args, **kwargs):
+            return await self._time_discord(f'{route.method} {route.path}', request(route, *args, **kwargs))
+
+        @functools.wraps(get_from_cdn)
+        async def timed_get_from_cdn(url: str):
+            return await self._time_discord(CDN_ROUTE, get_from_cdn(url))
+
+        http.request = timed_request
+        http.get_from_cdn = timed_get_from_cdn
+
+    def snapshot(self) -> str:
+        """Render the aggregated handler statistics, slowest handlers first"""
+        lines = [f'{"handler":<60} {"calls":>7} {"slow":>5} {"avg ms":>9} {"max ms":>9} '
+                 f'{"storage ms":>11} {"discord ms":>11}']
+        for name, stats in sorted(self.statistics.items(), key=lambda item: -item[1].total):
+            average = stats.total / stats.calls if stats.calls else 0
+            lines.append(f'{name:<60} {stats.calls:>7} {stats.slow_calls:>5} '
+                         f'{average * 1000:>9.1f} {stats.maximum * 1000:>9.1f} '
+                         f'{stats.storage * 1000:>11.1f} {stats.discord * 1000:>11.1f}')
+        return '\n'.join(lines)
+
+    async def profile(self, seconds: float, limit: int = 40) -> str:
+        """Run cProfile on the event loop thread for a number of seconds and render the results
+
+        Raises:
+            RuntimeError: Raised when another profile is already running
+        """
+        if self._profile_lock.locked():
+            raise RuntimeError('A profile is already running')
+
+        async with self._profile_lock:
+            profile = cProfile.Profile()
+            profile.enable()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                profile.disable()
+
+        output = io.StringIO()
+        pstats.Stats(profile, stream=output).sort_stats(
+            pstats.SortKey.CUMULATIVE).print_stats(limit)
+        return output.getvalue()
+
+    def _wrap_handler(self, name: str, handler: Callable[..., Any]) -> Callable[..., Any]:
+        @functools.wraps(handler)
+        async def timed_handler(*args, **kwargs):
+            timing = CallTiming()
+            token = _current_call.set(timing)
+            start = time.perf_counter()
+            try:
+                return await handler(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                _current_call.reset(token)
+                self._record(name, elapsed, timing)
+        return timed_handler
+
+    def _wrap_storage(self, method: Callable[..., Any]) -> Callable[..., Any]:
+        @functools.wraps(method)
+        def timed_method(*args, **kwargs):
+            timing = _current_call.get()
+            # Nested Storage calls are already accounted for by the outermost call
+            if timing is None or timing.in_storage:
+                return method(*args, **kwargs)
+
+            timing.in_storage = True
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                timing.storage += time.perf_counter() - start
+                timing.in_storage = False
+        return timed_method
+
+    async def _time_discord(self, route: str, awaitable):
+        timing = _current_call.get()
+        if timing is None:
+            return await awaitable
+
+        start = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            elapsed = time.perf_counter() - start
+            timing.discord += elapsed
+            timing.discord_routes[route] = timing.discord_routes.get(route, 0) + elapsed
+
+    def _record(self, name: str, elapsed: float, timing: CallTiming):
+        stats = self.statistics.setdefault(name, HandlerStatistics())
+        stats.calls += 1
+        stats.total += elapsed
+        stats.maximum = max(stats.maximum, elapsed)
+        stats.storage += timing.storage
+        stats.discord += timing.discord
+
+        if elapsed < self.slow_call_threshold:
+            return
+        stats.slow_calls += 1
+        routes = ', '.join(f'{route} {duration * 1000:.1f}ms' for route, duration
+                           in sorted(timing.discord_routes.items(), key=lambda item: -item[1]))
+        other = max(elapsed - timing.storage - timing.discord, 0)
+        getLogger(__name__).warning(
+            'Slow call to %s took %.1fms: storage %.1fms, discord %.1fms [%s], other %.1fms',
+            name, elapsed * 1000, timing.storage * 1000, timing.discord * 1000, routes, other * 1000)
@@ -1,14 +1,18 @@
 """Contains utility methods used throughout the package"""
+import os
+import time
+from collections import OrderedDict
 from logging import getLogger
-from typing import Callable, TypeVar, Coroutine, Sequence
+from typing import Callable, TypeVar, Coroutine, Sequence, Generic, Hashable
 from datetime import datetime
 import pytz
 import discord
 
 
 T = TypeVar('T')
+K = TypeVar('K', bound=Hashable)
+V = TypeVar('V')
 
-EVENT_ROLE_NAME = 'Events'
 
 EMOJIS = [
     ('Tank', '<:Tank:1318563147971563541>'),
@@ -56,6 +60,80 @@ EMOJIS = [
 ]
 
 
+class LRUCache(Generic[K, V]):
+    """A bounded mapping which evicts the least recently used entry once full,
+        and optionally expires entries a fixed amount of seconds after they were put
+    """
+
+    def __init__(self, maxsize: int, ttl: float | None = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = OrderedDict[K, tuple[V, float | None]]()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: K) -> bool:
+        return key in self._entries
+
+    def keys(self) -> list[K]:
+        """All keys, from least to most recently used"""
+        return list(self._entries.keys())
+
+    def get(self, key: K, default: V | None = None) -> V | None:
+        """Retrieve an entry, marking it as most recently used"""
+        entry = self._entries.get(key, None)
+        if entry is None:
+            self.misses += 1
+            return default
+
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return default
+
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return value
+
+    def peek(self, key: K, default: V | None = None) -> V | None:
+        """Retrieve an entry without counting it as a hit or marking it as recently used"""
+        entry = self._entries.get(key, None)
+        if entry is None:
+            return default
+        return entry[0]
+
+    def values(self) -> list[V]:
+        """All values, from least to most recently used"""
+        return [entry[0] for entry in self._entries.values()]
+
+    def clear(self):
+        """Remove all entries"""
+        self._entries.clear()
+
+    def put(self, key: K, value: V):
+        """Insert or overwrite an entry, evicting the least recently used entry when full"""
+        expires_at = None if self.ttl is None else time.monotonic() + self.ttl
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: K, default: V | None = None) -> V | None:
+        """Remove an entry"""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return default
+        return entry[0]
+
+
 async def grab_by_id(a_id: int, get_from_cache: Callable[[int], T],
                      fetch_from_api: Coroutine[None, int, T]) -> T | None:
     """Grabs a Discord resource by ID. First from cache, then from API calls
@@ -72,7 +150,8 @@ async def grab_by_id(a_id: int, get_from_cache: Callable[[int], T],
     if result is None:
         try:
             getLogger(__name__).info(
-                'Using %s to fetch resource with ID: %s', fetch_from_api.__name__, a_id)
+                'Using %s to fetch resource with ID: %s', fetch_from_api.__name__, a_id,
+                extra={'sampled': True})
             result = await fetch_from_api(a_id)
         except (discord.NotFound, discord.HTTPException) as e:
             getLogger(__name__).error(
@@ -81,6 +160,53 @@ async def grab_by_id(a_id: int, get_from_cache: Callable[[int], T],
     return result
 
 
+def get_env_flag(name: str) -> bool:
+    """Whether an environment variable is set to a truthy value such as '1', 'true' or 'yes'"""
+    return os.getenv(name, '').strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def get_env_float(name: str, default: float) -> float:
+    """Read a numeric environment variable, falling back to a default when unset or invalid"""
+    value = os.getenv(name)
+    if value is None or value.strip() == '':
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        getLogger(__name__).warning(
+            'Ignoring invalid value %s for %s, using %s', value, name, default)
+        return default
+
+
+def get_env_int(name: str, default: int) -> int:
+    """Read an integer environment variable, falling back to a default when unset or invalid"""
+    return int(get_env_float(name, default))
+
+
+async def get_display_name(guild: discord.Guild, user: discord.abc.Snowflake,
+                           display_names: LRUCache[tuple[int, int], str]) -> str:
+    """Get the display name of a user within a guild without relying on a full member cache
+
+    Args:
+        guild (discord.Guild): The guild to get the display name in
+        user (discord.abc.Snowflake): The user, which may be a partial object
+        display_names (LRUCache[tuple[int, int], str]): Display names by guild and user ID
+
+    Returns:
+        str: The display name of the member, or of the user when they're not part of the guild
+    """
+    member = guild.get_member(user.id)
+    if member is not None:
+        return member.display_name
+
+    name = display_names.get((guild.id, user.id))
+    if name is None:
+        member = await grab_by_id(user.id, guild.get_member, guild.fetch_member)
+        name = getattr(member or user, 'display_name', None) or f'User {user.id}'
+        display_names.put((guild.id, user.id), name)
+    return name
+
+
 def get_emoji_by_name(emojis: Sequence[discord.Emoji], name: str) -> str:
     """Find an emoji in a sequence by its name, returning a default emoji when not found
 
@@ -97,17 +223,6 @@ def get_emoji_by_name(emojis: Sequence[discord.Emoji], name: str) -> str:
     return '❓'
 
 
-async def get_event_role(guild: discord.Guild) -> discord.Role:
-    "Retrieves the Event role from a Guild, defaulting to guild's default role"
-    if len(guild.roles) == 0:
-        await guild.fetch_roles()
-
-    for role in guild.roles:
-        if role.name == EVENT_ROLE_NAME:
-            return role
-    return guild.default_role
-
-
 def strptime_no_exception(datetime_str: str, format_str) -> datetime | None:
     """Executes datetime.strptime without throwing an exception"""
     try:
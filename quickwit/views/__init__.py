@@ -1,4 +1,5 @@
 """Includes all event representations"""
-from .discord_ui import JoinButton, LeaveButton, StatusSelect, JobSelect, \
+from .discord_ui import JoinButton, LeaveButton, StatusSelect, JobSelect, PageButton, \
     ButtonCallback, StatusSelectCallback, JobSelectCallback
-from .discord_message import EventMessage, RegistrationMessage
+from .discord_message import EventMessage, RegistrationMessage, EventListMessage
+from .ics import CalendarFeed
@@ -2,7 +2,7 @@
 from typing import Sequence
 import discord
 from quickwit.utils import get_emoji_by_name
-from quickwit.models import Event, Registration, Status
+from quickwit.models import Event, EventSummary, FF14Job, Registration, Status
 
 DEFAULT_DURATION_MINUTES = 60
 START_EMOJI_NAME = 'Start'
@@ -30,8 +30,11 @@ class RegistrationMessage:
             if job_emoji == '❓':
                 job_emoji = self.registration.job
 
-            return f'{job_emoji} <@{self.registration.user_id}>'
-        return f'<@{self.registration.user_id}>'
+            return f'{job_emoji} <@{self.registration.user_id}>{self._waitlist_suffix()}'
+        return f'<@{self.registration.user_id}>{self._waitlist_suffix()}'
+
+    def _waitlist_suffix(self) -> str:
+        return ' (waitlist)' if self.registration.waitlisted else ''
 
 
 class EventMessage:
@@ -76,6 +79,14 @@ class EventMessage:
 
         # Finish with representing attendeeds
         message += f'\n\n{self.event.description}\n\n{people_emoji} {guaranteed_attendees} - {maximum_attendees} Attendees:'  # noqa
+        if self.event.composition is not None:
+            composition = self.event.composition
+            message += ' ' + ' '.join(f'{get_emoji_by_name(self.emojis, role)} '
+                                      f'{composition.counts.get(role, 0)}/{cap}'
+                                      for role, cap in composition.caps.items())
+            flexible = composition.counts.get(None, 0)
+            if flexible:
+                message += f' {get_emoji_by_name(self.emojis, FF14Job.ALL_ROUNDER)} {flexible}'
 
         for status, registrations in split_registrations.items():
             if len(registrations) == 0:
@@ -99,5 +110,27 @@ class EventMessage:
                 registration
                 for registration
                 in registrations
-                if registration.status == status.value]
+                # Waitlisted members are benched until promoted, whatever they signed up as
+                if (Status.BENCH if registration.waitlisted else registration.status) == status.value]
         return split_registrations
+
+
+class EventListMessage:
+    """Represents a page of listed events"""
+
+    def __init__(self, events: list[EventSummary], emojis: Sequence[discord.Emoji]):
+        self.events = events
+        self.emojis = emojis
+
+    def __str__(self):
+        if not self.events:
+            return 'No upcoming events found'
+
+        people_emoji = get_emoji_by_name(self.emojis, PEOPLE_EMOJI_NAME)
+        lines = []
+        for event in self.events:
+            start = int(event.utc_start.timestamp())
+            lines.append(f'{get_emoji_by_name(self.emojis, event.event_type)} **{event.name}** '
+                         f'<#{event.channel_id}> <t:{start}:F> (<t:{start}:R>) '
+                         f'{people_emoji} {event.registrations}')
+        return '\n'.join(lines)
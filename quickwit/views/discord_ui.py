@@ -58,3 +58,11 @@ class JobSelect(discord.ui.Select):
 
     async def callback(self, interaction):
         return await self._true_callback(interaction, self.values[0])
+
+
+class PageButton(discord.ui.Button):
+    """Button for moving to another page of a listing"""
+
+    def __init__(self, label: str, callback: ButtonCallback, disabled: bool):
+        super().__init__(label=label, style=discord.ButtonStyle.secondary, disabled=disabled)
+        self.callback = callback
@@ -0,0 +1,73 @@
+"""Contains all necessary classes for representing events in iCalendar format"""
+from datetime import datetime, timezone
+from discord.utils import snowflake_time
+from quickwit.models import Event
+
+MAX_LINE_OCTETS = 75
+DISCORD_CHANNEL_URL = 'https://discord.com/channels'
+
+
+def escape_text(text: str) -> str:
+    """Escape a value for use as iCalendar text"""
+    return text.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,') \
+        .replace('\r\n', '\\n').replace('\n', '\\n')
+
+
+def fold_line(line: str) -> str:
+    """Fold a content line into lines of at most 75 octets, without splitting characters"""
+    folded = []
+    current = ''
+    for character in line:
+        # Continuation lines start with a space, which counts towards their length
+        limit = MAX_LINE_OCTETS if not folded else MAX_LINE_OCTETS - 1
+        if len((current + character).encode()) > limit:
+            folded.append(current)
+            current = ''
+        current += character
+    folded.append(current)
+    return '\r\n '.join(folded)
+
+
+def format_datetime(moment: datetime) -> str:
+    """Format a datetime as an iCalendar UTC date-time"""
+    return moment.astimezone(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+class CalendarFeed:
+    """Represents a set of events as an iCalendar feed"""
+
+    def __init__(self, name: str, events: list[Event], organisers: dict[int, str]):
+        self.name = name
+        self.events = events
+        self.organisers = organisers
+
+    def event_lines(self, event: Event) -> list[str]:
+        """Generates the lines of a single VEVENT, stamped with the creation time of its channel
+            so rendering the same events twice gives the same feed
+        """
+        url = f'{DISCORD_CHANNEL_URL}/{event.guild_id}/{event.channel_id}'
+        organiser = self.organisers.get(event.organiser_id, f'User {event.organiser_id}')
+        description = f'{event.description}\n\nOrganised by {organiser}\n{url}'
+        return ['BEGIN:VEVENT',
+                f'UID:{event.channel_id}@quickwit',
+                f'DTSTAMP:{format_datetime(snowflake_time(event.channel_id))}',
+                f'DTSTART:{format_datetime(event.utc_start)}',
+                f'DTEND:{format_datetime(event.utc_end)}',
+                f'SUMMARY:{escape_text(event.name)}',
+                f'DESCRIPTION:{escape_text(description)}',
+                f'ORGANIZER;CN="{organiser.replace('"', "'")}":{url}',
+                f'CATEGORIES:{escape_text(event.event_type)}',
+                f'URL:{url}',
+                'END:VEVENT']
+
+    def __str__(self):
+        lines = ['BEGIN:VCALENDAR',
+                 'VERSION:2.0',
+                 'PRODID:-//quickwit//events//EN',
+                 'CALSCALE:GREGORIAN',
+                 'METHOD:PUBLISH',
+                 f'X-WR-CALNAME:{escape_text(self.name)}']
+        for event in self.events:
+            lines.extend(self.event_lines(event))
+        lines.append('END:VCALENDAR')
+        return ''.join(f'{fold_line(line)}\r\n' for line in lines)
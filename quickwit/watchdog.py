@@ -0,0 +1,74 @@
+"""Provides a watchdog detecting event loop stalls"""
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from logging import getLogger
+from quickwit.metrics import metrics
+
+DEFAULT_HEARTBEAT_MS = 50
+
+
+class LoopWatchdog:
+    """Measures event loop lag through a heartbeat coroutine and a monitoring thread
+
+    The heartbeat coroutine records when the loop last got to run it, the monitoring thread
+    captures the stack of the event loop thread whenever that heartbeat is overdue.
+    """
+
+    def __init__(self, threshold_ms: float, heartbeat_ms: float = DEFAULT_HEARTBEAT_MS):
+        self.threshold = threshold_ms / 1000
+        self.heartbeat = heartbeat_ms / 1000
+        self._last_beat = time.monotonic()
+        self._loop_thread_id = None
+        self._captured_beat = None
+        self._task = None
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._monitor, name='quickwit-watchdog', daemon=True)
+
+    def start(self):
+        """Start the watchdog, must be called from within the event loop to watch"""
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._task = asyncio.create_task(self._beat())
+        self._thread.start()
+        getLogger(__name__).info('Watching event loop for stalls over %.0fms',
+                                 self.threshold * 1000)
+
+    def stop(self):
+        """Stop the watchdog"""
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _beat(self):
+        while True:
+            before = time.monotonic()
+            self._last_beat = before
+            await asyncio.sleep(self.heartbeat)
+            lag = time.monotonic() - before - self.heartbeat
+            metrics.observe('event_loop_lag_seconds', lag)
+            if lag >= self.threshold:
+                metrics.increment('event_loop_stalls')
+                metrics.observe('event_loop_stall_seconds', lag)
+                getLogger(__name__).warning('Event loop stalled for %.1fms', lag * 1000)
+
+    def _monitor(self):
+        while not self._stopped.wait(self.heartbeat):
+            last_beat = self._last_beat
+            if time.monotonic() - last_beat < self.threshold + self.heartbeat:
+                continue
+
+            # Only capture the stack once per stall
+            if self._captured_beat == last_beat:
+                continue
+            self._captured_beat = last_beat
+
+            frame = sys._current_frames().get(self._loop_thread_id)  # pylint: disable=protected-access
+            if frame is None:
+                continue
+            stack = ''.join(traceback.format_stack(frame))
+            getLogger(__name__).warning(
+                'Event loop blocked for over %.0fms in:\n%s', self.threshold * 1000, stack)
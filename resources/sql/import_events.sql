@@ -0,0 +1,15 @@
+INSERT INTO Events (channel_id, event_type, name, description, scheduled_event_id, organiser_id, utc_start, utc_end, guild_id, reminder, tank_cap, healer_cap, dps_cap)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(channel_id) DO UPDATE SET
+    event_type = excluded.event_type,
+    name = excluded.name,
+    description = excluded.description,
+    scheduled_event_id = excluded.scheduled_event_id,
+    organiser_id = excluded.organiser_id,
+    utc_start = excluded.utc_start,
+    utc_end = excluded.utc_end,
+    guild_id = excluded.guild_id,
+    reminder = excluded.reminder,
+    tank_cap = excluded.tank_cap,
+    healer_cap = excluded.healer_cap,
+    dps_cap = excluded.dps_cap;
@@ -1,5 +1,6 @@
-INSERT INTO Registrations (channel_id, user_id, job, status)
-VALUES (?, ?, ?, ?)
+INSERT INTO Registrations (channel_id, user_id, job, status, waitlisted)
+VALUES (?, ?, ?, ?, COALESCE(?, 0))
 ON CONFLICT(channel_id, user_id) DO UPDATE SET
     job = excluded.job,
-    status = excluded.status;
+    status = excluded.status,
+    waitlisted = excluded.waitlisted;
@@ -0,0 +1,4 @@
+-- Old versions of this bot used differing event_type names, ensure they're modernized
+UPDATE Events SET event_type='Final Fantasy XIV' WHERE event_type='FF14Event';
+UPDATE Events SET event_type='Fashion Show' WHERE event_type='FashionShow';
+UPDATE Events SET event_type='Campfire Event' WHERE event_type='CampfireEvent';
@@ -0,0 +1,7 @@
+-- Create the ChangeLog table so processes sharing the database can invalidate their caches
+CREATE TABLE IF NOT EXISTS ChangeLog (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, -- Monotonically increasing change ID
+    channel_id INTEGER NOT NULL, -- Discord Channel ID of the changed event
+    origin TEXT NOT NULL, -- Process which made the change
+    changed_at INTEGER NOT NULL -- Seconds since epoch when the change was made
+);
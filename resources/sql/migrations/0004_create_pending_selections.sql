@@ -0,0 +1,10 @@
+-- Create the PendingSelections table to remember selections made before joining an event
+CREATE TABLE IF NOT EXISTS PendingSelections (
+    user_id INTEGER NOT NULL, -- Discord User ID
+    channel_id INTEGER NOT NULL, -- Discord Channel ID for event
+    status TEXT, -- Selected attendance status
+    job TEXT, -- Selected job
+    updated_at INTEGER NOT NULL, -- Seconds since epoch when the selection was last changed
+    PRIMARY KEY (user_id, channel_id),
+    FOREIGN KEY (channel_id) REFERENCES Events(channel_id) ON DELETE CASCADE
+);
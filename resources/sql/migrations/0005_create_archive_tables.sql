@@ -0,0 +1,22 @@
+-- Create the ArchivedEvents table to keep a compact history of ended events
+CREATE TABLE IF NOT EXISTS ArchivedEvents (
+    channel_id INTEGER PRIMARY KEY, -- Discord Channel ID the event used to have
+    event_type TEXT NOT NULL, -- Event type
+    name TEXT NOT NULL, -- Name of the event
+    organiser_id INTEGER NOT NULL, -- Discord User ID of the event organiser
+    utc_start INTEGER NOT NULL, -- Seconds since epoch until event start in UTC
+    utc_end INTEGER NOT NULL, -- Seconds since epoch until event end in UTC
+    guild_id INTEGER NOT NULL -- Discord Guild ID
+);
+
+-- Create the ArchivedRegistrations table to keep the attendance history of ended events
+CREATE TABLE IF NOT EXISTS ArchivedRegistrations (
+    channel_id INTEGER NOT NULL, -- Discord Channel ID the event used to have
+    user_id INTEGER NOT NULL, -- Discord User ID
+    job TEXT, -- Registered job
+    status TEXT, -- User's attendance status
+    PRIMARY KEY (channel_id, user_id)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS ArchivedEventsByGuild ON ArchivedEvents (guild_id, utc_start);
+CREATE INDEX IF NOT EXISTS ArchivedRegistrationsByUser ON ArchivedRegistrations (user_id);
@@ -0,0 +1,58 @@
+-- Create the UserStats table to count the attendance of every user per guild
+CREATE TABLE IF NOT EXISTS UserStats (
+    guild_id INTEGER NOT NULL, -- Discord Guild ID
+    user_id INTEGER NOT NULL, -- Discord User ID
+    signups INTEGER NOT NULL DEFAULT 0, -- Amount of events the user registered for
+    dropped INTEGER NOT NULL DEFAULT 0, -- Amount of events the user unregistered from
+    attended INTEGER NOT NULL DEFAULT 0, -- Amount of ended events the user was attending or late for
+    benched INTEGER NOT NULL DEFAULT 0, -- Amount of ended events the user was benched for
+    tentative INTEGER NOT NULL DEFAULT 0, -- Amount of ended events the user was tentative for
+    PRIMARY KEY (guild_id, user_id)
+) WITHOUT ROWID;
+
+-- Create the JobStats table to count how often every user played each job per guild
+CREATE TABLE IF NOT EXISTS JobStats (
+    guild_id INTEGER NOT NULL, -- Discord Guild ID
+    user_id INTEGER NOT NULL, -- Discord User ID
+    job TEXT NOT NULL, -- Played job
+    plays INTEGER NOT NULL DEFAULT 0, -- Amount of ended events the user attended as this job
+    PRIMARY KEY (guild_id, user_id, job)
+) WITHOUT ROWID;
+
+-- Create the GuildStats table to count the attendance of all events per guild
+CREATE TABLE IF NOT EXISTS GuildStats (
+    guild_id INTEGER PRIMARY KEY, -- Discord Guild ID
+    events INTEGER NOT NULL DEFAULT 0, -- Amount of ended events
+    signups INTEGER NOT NULL DEFAULT 0, -- Amount of registrations made
+    dropped INTEGER NOT NULL DEFAULT 0, -- Amount of registrations withdrawn
+    attended INTEGER NOT NULL DEFAULT 0, -- Amount of attending or late registrations of ended events
+    benched INTEGER NOT NULL DEFAULT 0, -- Amount of benched registrations of ended events
+    members INTEGER NOT NULL DEFAULT 0 -- Amount of users with statistics, so it's read without counting them
+);
+
+-- Seed the counters derived from events archived before statistics were kept
+INSERT INTO UserStats (guild_id, user_id, attended, benched, tentative)
+SELECT e.guild_id, r.user_id, SUM(r.status IN ('Attending', 'Late')), SUM(r.status = 'Bench'),
+    SUM(r.status = 'Tentative')
+FROM ArchivedRegistrations r JOIN ArchivedEvents e USING (channel_id)
+GROUP BY e.guild_id, r.user_id;
+
+INSERT INTO JobStats (guild_id, user_id, job, plays)
+SELECT e.guild_id, r.user_id, r.job, COUNT(*)
+FROM ArchivedRegistrations r JOIN ArchivedEvents e USING (channel_id)
+WHERE r.job IS NOT NULL AND r.status IN ('Attending', 'Late')
+GROUP BY e.guild_id, r.user_id, r.job;
+
+INSERT INTO GuildStats (guild_id, events, attended, benched, members)
+SELECT e.guild_id, COUNT(DISTINCT e.channel_id), COALESCE(SUM(r.status IN ('Attending', 'Late')), 0),
+    COALESCE(SUM(r.status = 'Bench'), 0),
+    (SELECT COUNT(*) FROM UserStats u WHERE u.guild_id = e.guild_id)
+FROM ArchivedEvents e LEFT JOIN ArchivedRegistrations r USING (channel_id)
+GROUP BY e.guild_id;
+
+-- Upserts updating an existing row don't fire insert triggers, so every member is counted once
+CREATE TRIGGER IF NOT EXISTS CountGuildMember AFTER INSERT ON UserStats
+BEGIN
+    INSERT INTO GuildStats (guild_id, members) VALUES (NEW.guild_id, 1)
+    ON CONFLICT (guild_id) DO UPDATE SET members=members+1;
+END;
@@ -0,0 +1,5 @@
+-- Index the events of every guild by start, so listings can page through them with a cursor
+CREATE INDEX IF NOT EXISTS EventsByGuild ON Events (guild_id, utc_start, channel_id);
+
+-- Index registrations by user, so the events a user registered for are found without a scan
+CREATE INDEX IF NOT EXISTS RegistrationsByUser ON Registrations (user_id, channel_id);
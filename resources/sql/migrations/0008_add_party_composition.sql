@@ -0,0 +1,7 @@
+-- Allow capping the amount of members per role of an event, NULL when the event is uncapped
+ALTER TABLE Events ADD COLUMN tank_cap INTEGER;
+ALTER TABLE Events ADD COLUMN healer_cap INTEGER;
+ALTER TABLE Events ADD COLUMN dps_cap INTEGER;
+
+-- Mark registrations which were benched automatically, as they're promoted once there's room
+ALTER TABLE Registrations ADD COLUMN waitlisted INTEGER NOT NULL DEFAULT 0;
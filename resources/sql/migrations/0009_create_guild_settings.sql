@@ -0,0 +1,5 @@
+-- Create the GuildSettings table to store guild-specific configuration
+CREATE TABLE IF NOT EXISTS GuildSettings (
+    guild_id INTEGER PRIMARY KEY, -- Discord Guild ID
+    event_role_name TEXT -- Name of the role mentioned by events, NULL for the default name
+);
@@ -0,0 +1,12 @@
+-- Create the ScheduledEventSubscribers table to remember who registered through a scheduled event
+CREATE TABLE IF NOT EXISTS ScheduledEventSubscribers (
+    channel_id INTEGER NOT NULL, -- Discord Channel ID for event
+    user_id INTEGER NOT NULL, -- Discord User ID
+    PRIMARY KEY (channel_id, user_id),
+    FOREIGN KEY (channel_id) REFERENCES Events(channel_id) ON DELETE CASCADE
+);
+
+-- Subscribers of existing events are unknown, they're remembered on their first catch up rather than
+-- registered, as members may have left through the UI since
+ALTER TABLE Events ADD COLUMN subscribers_known INTEGER NOT NULL DEFAULT 1; -- Whether all subscribers are remembered
+UPDATE Events SET subscribers_known=0;
@@ -0,0 +1,13 @@
+-- Create the Outbox table holding Discord side effects committed along with state changes
+CREATE TABLE IF NOT EXISTS Outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, -- Order in which side effects were committed
+    idempotency_key TEXT NOT NULL UNIQUE, -- Identifies a side effect, enqueueing it twice is a no-op
+    kind TEXT NOT NULL, -- Handler to perform the side effect with
+    guild_id INTEGER NOT NULL, -- Discord Guild ID, only the process owning the guild performs it
+    payload TEXT NOT NULL, -- JSON arguments for the handler
+    attempts INTEGER NOT NULL DEFAULT 0, -- Failed attempts so far
+    available_at INTEGER NOT NULL, -- Seconds since epoch after which the next attempt is due
+    last_error TEXT -- Error of the last failed attempt
+);
+
+CREATE INDEX IF NOT EXISTS OutboxByAvailability ON Outbox (available_at);